@@ -0,0 +1,103 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import hashlib
+import threading
+from nfcDatabase import AtomicFile, LockFile, NfcDatabase
+
+"""
+AnalysisCache stores the chip box and edge box found for an image, keyed by the sha256 of the image content and
+an optional extra key (e.g. the nfc feature number for Google). There is one file per vendor which records the
+detector fingerprint it was computed with - a different fingerprint (e.g. a bumped DETECTOR_VERSION) drops only
+the results of that vendor. Runs of the same vendor at the same time merge their results when they save.
+"""
+class AnalysisCache:
+    CACHE_DIR = "cache/analysis/"
+
+    def __init__(self, vendor, fingerprint, cache_dir=None):
+        self.vendor = vendor
+        self.fingerprint = str(fingerprint)
+        self.path_to_file = os.path.join(cache_dir or AnalysisCache.CACHE_DIR, vendor.lower() + ".json")
+        self._lock = threading.Lock()
+        self._results = {}
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+        data = self._read()
+        if data is not None:
+            if data["fingerprint"] == self.fingerprint:
+                self._results = data["results"]
+            else:
+                print("Detector of " + vendor + " changed, cached analysis results are dropped")
+                self._changed = True
+
+    def _read(self):
+        if not os.path.exists(self.path_to_file):
+            return None
+        try:
+            with open(self.path_to_file, "r") as f:
+                data = json.load(f)
+            return {"fingerprint": data["fingerprint"], "results": data["results"]}
+        except (OSError, ValueError, KeyError):
+            print("Error: Analysis cache " + self.path_to_file + " could not be read")
+            return None
+
+    @staticmethod
+    def content_hash(path_to_file):
+        content_hash = hashlib.sha256()
+        with open(path_to_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def key_of(path_to_file, *extra):
+        return ":".join([AnalysisCache.content_hash(path_to_file)] + [str(value) for value in extra])
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+        if result is None:
+            return None
+        nfc_box, edge_box = result
+        return tuple(nfc_box), tuple(edge_box)
+
+    def put(self, key, result):
+        nfc_box, edge_box = result
+        with self._lock:
+            self._results[key] = [[int(value) for value in nfc_box], [int(value) for value in edge_box]]
+            self._changed = True
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            os.makedirs(os.path.dirname(self.path_to_file) or ".", exist_ok=True)
+            with LockFile(self.path_to_file + ".lock", NfcDatabase.LOCK_TIMEOUT_SECONDS):
+                # keep the results another run of the vendor saved in the meantime
+                data = self._read()
+                if data is not None and data["fingerprint"] == self.fingerprint:
+                    self._results = dict(data["results"], **self._results)
+                with AtomicFile(self.path_to_file, "w") as f:
+                    json.dump({"vendor": self.vendor, "fingerprint": self.fingerprint, "results": self._results}, f)
+            self._changed = False
@@ -20,23 +20,91 @@
 
 
 import os
+import numpy as np
 import cv2 as cv
-import json
-import requests
-import pandas as pd
+from imageDownloader import ImageDownloader
+from googlePlayDeviceList import GooglePlayDeviceList
+from nfcDatabase import NfcDatabase
+from pipelineMetrics import PipelineMetrics
 
 
 class BaselineFunctions:
     @staticmethod
     def load_all_images_of_folder(folder):
-        images = []
-        file_names = []
+        # yields (file_name, img) - an image is only decoded when it is requested and can be dropped afterwards
         for file_name in os.listdir(folder):
-            img = cv.imread(os.path.join(folder, file_name))
+            img = BaselineFunctions.load_image(os.path.join(folder, file_name))
             if img is not None:
-                images.append(img)
-                file_names.append(file_name)
-        return images, file_names
+                yield file_name, img
+
+    @staticmethod
+    def load_image(path_to_file):
+        # cv.imdecode of the bytes instead of cv.imread, which fails on non-ASCII paths on Windows
+        with PipelineMetrics.span("decode"):
+            try:
+                data = np.fromfile(path_to_file, dtype=np.uint8)
+            except OSError:
+                return None
+            return cv.imdecode(data, cv.IMREAD_COLOR) if data.size > 0 else None
+
+    @staticmethod
+    def merge_edges(img_canny, kernel, iterations_list):
+        # yields (iterations, cv.erode(cv.dilate(img_canny, kernel, iterations), kernel, iterations)) for the
+        # ascending iterations_list - every dilation continues from the previous level instead of starting again
+        img_dil = img_canny
+        dilations = 0
+        for iterations in iterations_list:
+            img_dil = cv.dilate(img_dil, kernel, iterations=iterations - dilations)
+            dilations = iterations
+            yield iterations, cv.erode(img_dil, kernel, iterations=iterations)
+
+    @staticmethod
+    def find_phone_edge_coarse_to_fine(img, find_phone_edge, edge_map, levels, band=None):
+        # find_phone_edge(img) runs on the image downscaled levels times (cv.pyrDown), afterwards every side of the
+        # box is moved to the outermost strong edge line of edge_map(strip) at full resolution, only searched within
+        # band pixel around the scaled side. A side without any edge in its strip keeps the scaled value.
+        # cv.pyrDown of the decoded image instead of decoding it again with IMREAD_REDUCED_*: the full resolution is
+        # needed for the chip and the refinement anyway, and a second decode is slower (on a 2000 x 1430 render about
+        # 8 ms for JPEG, 44 ms for WebP and 63 ms for PNG at half resolution against 4 to 5 ms for pyrDown)
+        img_small = img
+        for _ in range(levels):
+            img_small = cv.pyrDown(img_small)
+        x0, y0, x1, y1 = find_phone_edge(img_small)
+        if x0 == -1:
+            return -1, -1, -1, -1
+        scale = 2 ** levels
+        if band is None:
+            band = 2 * scale
+        height, width = img.shape[:2]
+        x0, y0, x1, y1 = min(x0 * scale, width - 1), min(y0 * scale, height - 1), min(x1 * scale, width), \
+            min(y1 * scale, height)
+        x0 = BaselineFunctions._refine_side(img, edge_map, x0, y0, y1, band, True, True)
+        x1 = BaselineFunctions._refine_side(img, edge_map, x1 - 1, y0, y1, band, True, False) + 1
+        y0 = BaselineFunctions._refine_side(img, edge_map, y0, x0, x1, band, False, True)
+        y1 = BaselineFunctions._refine_side(img, edge_map, y1 - 1, x0, x1, band, False, False) + 1
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def _refine_side(img, edge_map, position, start, end, band, vertical, first):
+        # vertical: the side is a column at position spanning the rows start:end, otherwise a row spanning columns
+        size = img.shape[1] if vertical else img.shape[0]
+        low, high = max(0, position - band), min(size, position + band + 1)
+        strip = img[start:end, low:high] if vertical else img[low:high, start:end]
+        if strip.shape[0] < 3 or strip.shape[1] < 3:
+            return position
+        # number of edge pixel per column (vertical side) or row
+        profile = np.count_nonzero(edge_map(strip), axis=0 if vertical else 1)
+        if profile.max() == 0:
+            return position
+        strong = np.flatnonzero(profile * 2 >= profile.max())
+        return low + int(strong[0] if first else strong[-1])
+
+    @staticmethod
+    def detector_fingerprint(detector_version, edge_pyramid_levels):
+        # the coarse to fine edge detection gives slightly different boxes, its results are not mixed in the cache
+        if edge_pyramid_levels == 0:
+            return detector_version
+        return detector_version + "-pyramid" + str(edge_pyramid_levels)
 
     @staticmethod
     def delete_all_files_in_folder(folder):
@@ -44,34 +112,40 @@ class BaselineFunctions:
             os.remove(os.path.join(folder, file_name))
 
     @staticmethod
-    def download_image(path, phone_src, model_name, web_prefix=''):
-        path_to_file = path + str(model_name) + ".webp"
-        if not os.path.exists(path_to_file):
-            try:
-                phone_link = web_prefix + str(phone_src)
-                print("Downloading: " + phone_link)
-                phone_img = requests.get(phone_link, stream=True).content
-                with open(path_to_file, "wb+") as f:
-                    f.write(phone_img)
-            except:
-                print("Error: Download of " + str(model_name) + " did not succeed")
-                pass
-        else:
-            print("Image already exists at : " + path_to_file)
+    def download_images_as_completed(downloads):
+        # downloads is a list of (path, phone_src, model_name, web_prefix), images are loaded concurrently - yields
+        # the path of every image as soon as it is on disk (existing images first)
+        pending = []
+        existing = set()
+        for path, phone_src, model_name, web_prefix in downloads:
+            path_to_file = path + str(model_name) + ".webp"
+            if os.path.exists(path_to_file):
+                print("Image already exists at : " + path_to_file)
+                if path_to_file not in existing:
+                    existing.add(path_to_file)
+                    yield path_to_file
+            elif path_to_file not in [pending_file for _, pending_file in pending]:
+                pending.append((web_prefix + str(phone_src), path_to_file))
+        for phone_link, path_to_file, success in ImageDownloader.download_as_completed(pending):
+            if success:
+                yield path_to_file
+            else:
+                print("Error: Download of " + os.path.basename(path_to_file) + " did not succeed")
 
     @staticmethod
     def check_if_data_base_entry_exists(path, db_file_name, model_name):
-        path_to_file = path + str(db_file_name)
-        try:
-            with open(path_to_file, 'r') as f:
-                data_entries = json.load(f)
-            for data_entry in data_entries:
-                if data_entry["marketingName"] == str(model_name):
-                    return True
+        return NfcDatabase.get(path, db_file_name).contains_marketing_name(model_name)
+
+    @staticmethod
+    def needs_analysis(path, db_file_name, model_name, catalog=None):
+        # phones without database entry and phones whose image or nfc feature number changed on the vendor page
+        if catalog is not None and catalog.is_changed(model_name):
+            print("Changed on the vendor page: " + model_name)
+            return True
+        if catalog is not None and catalog.was_not_located(model_name):
+            print("No nfc chip found on the same image in the last run: " + model_name)
             return False
-        except:
-            print("Error: DataBaseFile " + str(db_file_name) + " could not be opened")
-            pass
+        return not BaselineFunctions.check_if_data_base_entry_exists(path, db_file_name, model_name)
 
     @staticmethod
     def nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge, x1_edge, y1_edge):
@@ -119,28 +193,5 @@ class BaselineFunctions:
         return nfc_chip_location
 
     @staticmethod
-    def write_to_json_file(nfc_chip_locations, path, filename):
-        full_path = path + filename
-        try:
-            if os.path.exists(full_path):
-                data = []
-                with open(full_path, 'r') as f:
-                    data_entries = json.load(f)
-                for data_entry in data_entries:
-                    data.append(data_entry)
-                for nfc_chip_location in nfc_chip_locations:
-                    if not nfc_chip_location["marketingName"] in data:
-                        data.append(nfc_chip_location)
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=5)
-            else:
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    json.dump(nfc_chip_locations, f, ensure_ascii=False, indent=5)
-        except:
-            print("Error: Path " + str(full_path) + " could not be reached")
-            pass
-
-    @staticmethod
-    def load_google_play_device_list():
-        url = "https://storage.googleapis.com/play_public/supported_devices.csv"
-        return pd.read_csv(url, encoding="utf-16")
+    def load_google_play_device_list(cache_dir=None):
+        return GooglePlayDeviceList.load(cache_dir)
@@ -0,0 +1,111 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from bs4 import BeautifulSoup as bs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from catalogParser import CatalogParser, PhoneRecord
+
+"""
+Parse time and memory of the saved vendor pages: the former parse of the whole page with html.parser against
+CatalogParser, which only parses the elements with the phones, with html.parser and (if installed) lxml. Checks that
+all of them extract the same phones. The pages are the ones saved by benchmarkOffline.py --record.
+Usage: python benchmarks/benchmarkCatalogParsing.py [--samsung page.html] [--google page.html] [--huawei page.html]
+       [--runs 5]
+"""
+class BenchmarkCatalogParsing:
+    FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+    @staticmethod
+    def _full_tree_samsung(content):
+        results = bs(content, 'html.parser')
+        return [PhoneRecord(str(phone.find('div', class_='sm-text').text).strip(),
+                            str(phone.find('img', class_='product')["src"]), ())
+                for phone in results.find_all('div', class_='phone-item')]
+
+    @staticmethod
+    def _full_tree_google(content):
+        results = bs(content, 'html.parser')
+        content = results.find('div', class_='cc')
+        return [PhoneRecord(str(model_name.text), str(img["src"]),
+                            tuple(str(feature.text) for feature in feature_list.find_all('li')))
+                for img, model_name, feature_list in zip(content.find_all('img', class_=''),
+                                                         content.find_all(class_='zippy'), content.find_all('ol'))]
+
+    @staticmethod
+    def _full_tree_huawei(content):
+        results = bs(content, 'html.parser')
+        phones = results.find('div', class_='nfc').select('option')
+        phones.pop(0)
+        return [PhoneRecord(phone.text.strip(), phone.get('value'), ()) for phone in phones]
+
+    @staticmethod
+    def _measure(function, content, runs):
+        seconds = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            records = function(content)
+            seconds.append(time.perf_counter() - start)
+        tracemalloc.start()
+        function(content)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return sorted(seconds)[len(seconds) // 2], peak, records
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Parse time and memory of the vendor pages")
+        vendors = ["samsung", "google", "huawei"]
+        for vendor in vendors:
+            parser.add_argument("--" + vendor, help="saved page, default benchmarks/fixtures/" + vendor + "/page.html")
+        parser.add_argument("--runs", type=int, default=5)
+        args = parser.parse_args(arguments)
+        parsers = ["html.parser"] + (["lxml"] if CatalogParser.parser() == "lxml" else [])
+        success = True
+        for vendor in vendors:
+            page = getattr(args, vendor) or os.path.join(BenchmarkCatalogParsing.FIXTURES, vendor, "page.html")
+            if not os.path.exists(page):
+                continue
+            with open(page, "rb") as f:
+                content = f.read()
+            scenarios = [("full tree (html.parser)", getattr(BenchmarkCatalogParsing, "_full_tree_" + vendor))]
+            for name in parsers:
+                scenarios.append(("strained (" + name + ")", lambda data, name=name: getattr(
+                    CatalogParser, vendor + "_phones")(data, name)))
+            print(vendor + ": " + str(len(content)) + " bytes")
+            expected = None
+            for name, function in scenarios:
+                seconds, peak, records = BenchmarkCatalogParsing._measure(function, content, args.runs)
+                expected = records if expected is None else expected
+                print("  " + name + ": median " + str(round(seconds * 1000, 2)) + " ms, peak memory " +
+                      str(round(peak / (1024 * 1024), 2)) + " MB, " + str(len(records)) + " phones" +
+                      ("" if records == expected else " - Error: different phones than the full tree"))
+                success = success and records == expected
+        return success
+
+
+if __name__ == "__main__":
+    BenchmarkCatalogParsing.main(sys.argv[1:])
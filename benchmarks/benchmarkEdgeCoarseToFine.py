@@ -0,0 +1,114 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from baselineFunctions import BaselineFunctions as base
+from findNfcChipForSamsung import FindNfcChipForSamsung
+from findNfcChipForHuawei import FindNfcChipForHuawei
+from findNfcChipForGoogle import FindNfcChipForGoogle
+
+"""
+Compares the coarse to fine phone edge detection (EDGE_PYRAMID_LEVELS > 0) with the full resolution detection on the
+images of a folder per vendor. Reports per vendor and level the median time per image, the speedup, the mean IoU of
+the boxes and how far the sides are apart (in pixel and in percent of the phone size).
+Usage: python benchmarks/benchmarkEdgeCoarseToFine.py [--samsung samsung/phones/] [--huawei huawei/phones/]
+       [--google google/phones/] [--levels 1 2]
+"""
+class BenchmarkEdgeCoarseToFine:
+    VENDORS = {"samsung": FindNfcChipForSamsung, "huawei": FindNfcChipForHuawei, "google": FindNfcChipForGoogle}
+
+    @staticmethod
+    def _iou(box_a, box_b):
+        x0, y0 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+        x1, y1 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+        intersection = max(0, x1 - x0) * max(0, y1 - y0)
+        union = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1]) + (box_b[2] - box_b[0]) * (box_b[3] - box_b[1]) - \
+            intersection
+        return intersection / union if union > 0 else 0.0
+
+    @staticmethod
+    def _timed(vendor_class, levels, img, file_name):
+        start = time.perf_counter()
+        box = vendor_class._find_phone_edge_in_image(img, file_name, levels)
+        return time.perf_counter() - start, box
+
+    @staticmethod
+    def _median(values):
+        values = sorted(values)
+        return values[len(values) // 2] if len(values) > 0 else 0.0
+
+    @staticmethod
+    def compare(vendor_class, folder, levels_list):
+        full_seconds = []
+        # levels -> ([seconds], [iou], [side deviation in pixel], [side deviation in percent], missing)
+        coarse = {levels: ([], [], [], [], 0) for levels in levels_list}
+        for file_name, img in base.load_all_images_of_folder(folder):
+            seconds, full_box = BenchmarkEdgeCoarseToFine._timed(vendor_class, 0, img, file_name)
+            full_seconds.append(seconds)
+            for levels in levels_list:
+                seconds, box = BenchmarkEdgeCoarseToFine._timed(vendor_class, levels, img, file_name)
+                times, ious, deviations, percents, missing = coarse[levels]
+                times.append(seconds)
+                if full_box[0] == -1 or box[0] == -1:
+                    # only counted if just one of both found an edge
+                    coarse[levels] = times, ious, deviations, percents, missing + (full_box[0] != box[0])
+                    continue
+                deviation = max(abs(a - b) for a, b in zip(full_box, box))
+                ious.append(BenchmarkEdgeCoarseToFine._iou(full_box, box))
+                deviations.append(deviation)
+                percents.append(100 * deviation / max(1, min(full_box[2] - full_box[0], full_box[3] - full_box[1])))
+        full_median = BenchmarkEdgeCoarseToFine._median(full_seconds)
+        print(folder + ": " + str(len(full_seconds)) + " images, full resolution median " +
+              str(round(full_median * 1000, 1)) + " ms")
+        for levels, (times, ious, deviations, percents, missing) in coarse.items():
+            median = BenchmarkEdgeCoarseToFine._median(times)
+            print("  levels " + str(levels) + ": median " + str(round(median * 1000, 1)) + " ms, speedup " +
+                  str(round(full_median / median, 2) if median > 0 else "-") + "x, mean IoU " +
+                  str(round(sum(ious) / len(ious), 4) if len(ious) > 0 else "-") + ", side deviation median " +
+                  str(BenchmarkEdgeCoarseToFine._median(deviations)) + " px / max " + str(max(deviations, default=0)) +
+                  " px (" + str(round(max(percents, default=0), 2)) + "% of the phone), found by only one: " +
+                  str(missing))
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Coarse to fine vs full resolution phone edge detection")
+        for vendor in BenchmarkEdgeCoarseToFine.VENDORS:
+            parser.add_argument("--" + vendor, help="image folder, default " + vendor + "/phones/ if it exists")
+        parser.add_argument("--levels", type=int, nargs="+", default=[1, 2])
+        args = parser.parse_args(arguments)
+        compared = False
+        for vendor, vendor_class in BenchmarkEdgeCoarseToFine.VENDORS.items():
+            folder = getattr(args, vendor) or vendor + "/phones/"
+            if os.path.isdir(folder) and len(os.listdir(folder)) > 0:
+                BenchmarkEdgeCoarseToFine.compare(vendor_class, folder, args.levels)
+                compared = True
+        if not compared:
+            print("Error: No image folder found")
+        return compared
+
+
+if __name__ == "__main__":
+    BenchmarkEdgeCoarseToFine.main(sys.argv[1:])
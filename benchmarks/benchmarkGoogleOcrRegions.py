@@ -0,0 +1,124 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import contextlib
+import subprocess
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from findNfcChipForGoogle import FindNfcChipForGoogle
+from ocrReaderPool import OcrReaderPool
+
+"""
+Compares the Google nfc-chip detection with OCR on the 4x upscaled full image ("full", the former behaviour) against
+OCR on the upscaled annotation regions only ("regions"). Every mode runs in its own process, so the peak RSS of the
+modes does not mix. The OCR models are loaded before the timing starts.
+Usage: python benchmarks/benchmarkGoogleOcrRegions.py [image folder] --feature-number 3
+       (or --feature-numbers numbers.json with {"file name": feature number})
+"""
+class BenchmarkGoogleOcrRegions:
+    MODES = ["full", "regions"]
+
+    @staticmethod
+    def _find_nfc_chip_on_full_image(img, feature_number):
+        img_gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+        if np.mean(img) < 125:
+            img_gray = cv.bitwise_not(img_gray)
+        scaled_img = cv.resize(img_gray, None, fx=4.0, fy=4.0, interpolation=cv.INTER_LINEAR)
+        x0_num, y0_num, x1_num, y1_num = FindNfcChipForGoogle._find_number_on_img_with_ocr(scaled_img, feature_number)
+        return FindNfcChipForGoogle._find_nfc_chip_near_number_coordinates(
+            FindNfcChipForGoogle._find_annotation_boxes(img), x0_num, y0_num, x1_num, y1_num)
+
+    @staticmethod
+    def _peak_rss_mb():
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes on linux
+        return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    @staticmethod
+    def run_mode(mode, folder, feature_numbers, default_feature_number):
+        OcrReaderPool.get_reader()
+        rss_after_load = BenchmarkGoogleOcrRegions._peak_rss_mb()
+        latencies = []
+        boxes = {}
+        for file_name in sorted(os.listdir(folder)):
+            img = cv.imread(os.path.join(folder, file_name))
+            if img is None:
+                continue
+            feature_number = feature_numbers.get(file_name, default_feature_number)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == "full":
+                    box = BenchmarkGoogleOcrRegions._find_nfc_chip_on_full_image(img, feature_number)
+                else:
+                    box = FindNfcChipForGoogle._find_nfc_chip_via_feature_number(img, file_name, feature_number)
+            latencies.append(time.perf_counter() - start)
+            boxes[file_name] = [int(value) for value in box]
+        return {"mode": mode, "latencies": latencies, "boxes": boxes, "peak_rss_after_model_load_mb": rss_after_load,
+                "peak_rss_mb": BenchmarkGoogleOcrRegions._peak_rss_mb()}
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Benchmark OCR on annotation regions against the full image")
+        parser.add_argument("folder", nargs="?", default="google/phones/")
+        parser.add_argument("--feature-number", type=int, default=3)
+        parser.add_argument("--feature-numbers", help="json file with {file name: nfc feature number}")
+        parser.add_argument("--mode", choices=BenchmarkGoogleOcrRegions.MODES, help=argparse.SUPPRESS)
+        args = parser.parse_args(arguments)
+        feature_numbers = {}
+        if args.feature_numbers:
+            with open(args.feature_numbers, "r") as f:
+                feature_numbers = json.load(f)
+        if args.mode:
+            print(json.dumps(BenchmarkGoogleOcrRegions.run_mode(args.mode, args.folder, feature_numbers,
+                                                                 args.feature_number)))
+            return True
+        reports = {}
+        for mode in BenchmarkGoogleOcrRegions.MODES:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__)] + arguments + ["--mode", mode],
+                                    check=True, capture_output=True, text=True).stdout
+            reports[mode] = json.loads(output.strip().splitlines()[-1])
+        for mode, report in reports.items():
+            latencies = report["latencies"]
+            mean = sum(latencies) / len(latencies) if len(latencies) > 0 else 0.0
+            found = sum(1 for box in report["boxes"].values() if box[0] != -1)
+            print(mode + ": " + str(len(latencies)) + " images, " + str(found) + " chips found, mean latency " +
+                  str(round(mean, 3)) + "s, peak RSS " + str(report["peak_rss_mb"]) + " MB (after model load " +
+                  str(report["peak_rss_after_model_load_mb"]) + " MB)")
+        differences = [file_name for file_name, box in reports["full"]["boxes"].items()
+                       if reports["regions"]["boxes"].get(file_name) != box]
+        print("Different boxes: " + str(len(differences)) + " " + str(differences))
+        return True
+
+
+if __name__ == "__main__":
+    BenchmarkGoogleOcrRegions.main(sys.argv[1:])
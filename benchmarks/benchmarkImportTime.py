@@ -0,0 +1,77 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+"""
+Measures the cold start of the typical entry points, every run in a fresh interpreter. Each scenario runs once as it
+is ("lazy") and once with the heavy packages easyocr (with torch) and pandas imported up front like the modules did
+before ("eager"), and reports the median time and which of the heavy packages got loaded.
+Usage: python benchmarks/benchmarkImportTime.py [--runs 5]
+"""
+class BenchmarkImportTime:
+    REPOSITORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    HEAVY_MODULES = ["easyocr", "torch", "pandas"]
+    SCENARIOS = {
+        "cli startup": "import runNfcLocalization",
+        "samsung run": "import runNfcLocalization\n"
+                       "runNfcLocalization.RunNfcLocalization.vendor_class('samsung')",
+        "google run": "import runNfcLocalization\n"
+                      "runNfcLocalization.RunNfcLocalization.vendor_class('google')",
+        "read-only query": "from nfcDatabase import NfcDatabase\n"
+                           "NfcDatabase.get('nfcChipsOutput/', 'nfc_positions.json').get_by_marketing_name('Pixel 8')",
+    }
+    EAGER_IMPORTS = "for name in ['easyocr', 'pandas']:\n" \
+                    "    try:\n" \
+                    "        __import__(name)\n" \
+                    "    except ImportError:\n" \
+                    "        pass\n"
+
+    @staticmethod
+    def _measure(code):
+        child = "import sys, time, json\n" \
+                "start = time.perf_counter()\n" + code + "\n" \
+                "print(json.dumps([time.perf_counter() - start, [name for name in " + \
+                json.dumps(BenchmarkImportTime.HEAVY_MODULES) + " if name in sys.modules]]))\n"
+        output = subprocess.run([sys.executable, "-c", child], cwd=BenchmarkImportTime.REPOSITORY, check=True,
+                                capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Cold start time of the entry points")
+        parser.add_argument("--runs", type=int, default=5)
+        args = parser.parse_args(arguments)
+        for name, code in BenchmarkImportTime.SCENARIOS.items():
+            for mode, mode_code in [("lazy", code), ("eager", BenchmarkImportTime.EAGER_IMPORTS + code)]:
+                measurements = [BenchmarkImportTime._measure(mode_code) for _ in range(args.runs)]
+                seconds = sorted(measurement[0] for measurement in measurements)
+                print(name + " (" + mode + "): median " + str(round(seconds[len(seconds) // 2] * 1000)) + " ms, " +
+                      "heavy modules loaded: " + (", ".join(measurements[-1][1]) or "none"))
+        return True
+
+
+if __name__ == "__main__":
+    BenchmarkImportTime.main(sys.argv[1:])
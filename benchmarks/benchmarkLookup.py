@@ -0,0 +1,111 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from nfcPositionLookup import NfcPositionLookup, NfcPositionSqlite
+
+"""
+Serving benchmark of the model name lookup: the former linear scan over the parsed nfc_positions.json, the in-memory
+NfcPositionLookup and the exported SQLite file. Reports the load time and the latency per lookup for a mix of exact
+model names, marketing names, model names with a suffix (prefix match) and unknown names.
+Usage: python benchmarks/benchmarkLookup.py [nfc_positions.json] [--lookups 20000]
+"""
+class BenchmarkLookup:
+    @staticmethod
+    def _linear_scan(entries, model_name):
+        for entry in entries:
+            if model_name in entry["modelNames"]:
+                return entry
+        return None
+
+    @staticmethod
+    def _queries(entries, count):
+        model_names = [model_name for entry in entries for model_name in entry["modelNames"]]
+        random.seed(1)
+        queries = []
+        for i in range(count):
+            kind = i % 4
+            if kind == 0:
+                queries.append(random.choice(model_names))
+            elif kind == 1:
+                queries.append(random.choice(entries)["marketingName"])
+            elif kind == 2:
+                queries.append(random.choice(model_names) + "/DS")
+            else:
+                queries.append("UNKNOWN-" + str(i))
+        return queries
+
+    @staticmethod
+    def _time_lookups(lookup, queries):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            lookup(query)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return latencies
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Latency of the nfc position lookups")
+        parser.add_argument("database", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                        "..", "nfcChipsOutput", "nfc_positions.json"))
+        parser.add_argument("--lookups", type=int, default=20000)
+        args = parser.parse_args(arguments)
+        with tempfile.TemporaryDirectory() as work_dir:
+            sqlite_file = os.path.join(work_dir, "nfc_positions.sqlite")
+            start = time.perf_counter()
+            with open(args.database, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            json_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            lookup = NfcPositionLookup.from_json(args.database)
+            index_seconds = time.perf_counter() - start
+            lookup.export_sqlite(sqlite_file)
+            start = time.perf_counter()
+            store = NfcPositionSqlite(sqlite_file)
+            store.lookup("warm up")
+            sqlite_seconds = time.perf_counter() - start
+            print("json " + str(os.path.getsize(args.database)) + " bytes, sqlite " +
+                  str(os.path.getsize(sqlite_file)) + " bytes, " + str(len(entries)) + " entries")
+            print("load: json parse " + str(round(json_seconds * 1000, 2)) + " ms, parse and index " +
+                  str(round(index_seconds * 1000, 2)) + " ms, sqlite open " + str(round(sqlite_seconds * 1000, 2)) +
+                  " ms")
+            queries = BenchmarkLookup._queries(entries, args.lookups)
+            for name, function in [("linear scan", lambda query: BenchmarkLookup._linear_scan(entries, query)),
+                                   ("in-memory index", lookup.lookup), ("sqlite", store.lookup)]:
+                latencies = BenchmarkLookup._time_lookups(function, queries)
+                print(name + ": median " + str(round(latencies[len(latencies) // 2] * 1e6, 2)) + " us, p99 " +
+                      str(round(latencies[int(len(latencies) * 0.99)] * 1e6, 2)) + " us")
+            store.close()
+        return True
+
+
+if __name__ == "__main__":
+    BenchmarkLookup.main(sys.argv[1:])
@@ -0,0 +1,231 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import tempfile
+import threading
+import subprocess
+from functools import partial
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from googlePlayDeviceList import GooglePlayDeviceList
+from imageDownloader import ImageDownloader
+from imageCache import ImageCache
+from pipelineMetrics import PipelineMetrics
+
+"""
+Offline end to end benchmark of the vendor pipelines. A local HTTP server serves a fixture folder instead of the
+vendor sites:
+    <fixtures>/supported_devices.csv      snapshot of Google Play's device list
+    <fixtures>/<vendor>/page.html         the saved vendor page
+    <fixtures>/<vendor>/<image path>      the images, at the path of their src on the page
+Every vendor main() runs in its own process on an empty database and empty caches. The benchmark reports the wall
+time, the latency percentiles per image, the peak memory and the IoU of the found boxes with the ground truth
+(nfcChipsOutput/nfc_positions.json). --record saves the live pages, images and device list as fixtures (needs network).
+Usage: python benchmarks/benchmarkOffline.py [fixture folder] [--vendors samsung google] [--workers 4] [--record]
+"""
+class BenchmarkOffline:
+    # vendor -> (module, class, manufacturer in nfc_positions.json)
+    VENDORS = {"samsung": ("findNfcChipForSamsung", "FindNfcChipForSamsung", "Samsung"),
+               "google": ("findNfcChipForGoogle", "FindNfcChipForGoogle", "Google"),
+               "huawei": ("findNfcChipForHuawei", "FindNfcChipForHuawei", "Huawei")}
+    PAGE_FILE_NAME = "page.html"
+    DEVICE_LIST_FILE_NAME = "supported_devices.csv"
+    REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+    @staticmethod
+    def _vendor_class(vendor):
+        module_name, class_name, _ = BenchmarkOffline.VENDORS[vendor]
+        return getattr(importlib.import_module(module_name), class_name)
+
+    @staticmethod
+    def _local_prefix(port, vendor):
+        return "http://127.0.0.1:" + str(port) + "/" + vendor + "/"
+
+    @staticmethod
+    def _fixture_file(fixtures, vendor, src):
+        # the file the local server answers for the image url of src (same mapping as SimpleHTTPRequestHandler)
+        path = unquote(urlsplit(BenchmarkOffline._local_prefix(0, vendor) + src).path)
+        parts = [part for part in path.split("/") if part not in ("", ".", "..")]
+        return os.path.join(fixtures, *parts)
+
+    @staticmethod
+    def record(fixtures, vendors):
+        session = ImageDownloader.get_session()
+        os.makedirs(fixtures, exist_ok=True)
+        BenchmarkOffline._fetch(session, GooglePlayDeviceList.URL,
+                                os.path.join(fixtures, BenchmarkOffline.DEVICE_LIST_FILE_NAME))
+        for vendor in vendors:
+            vendor_class = BenchmarkOffline._vendor_class(vendor)
+            BenchmarkOffline._fetch(session, vendor_class.URL,
+                                    os.path.join(fixtures, vendor, BenchmarkOffline.PAGE_FILE_NAME))
+            with tempfile.TemporaryDirectory() as work_dir:
+                # an empty database, so every phone on the page is listed
+                loaded = vendor_class._load_all_new_phone_images(vendor_class.URL, os.path.join(work_dir, "phones/"),
+                                                                 os.path.join(work_dir, ""), "empty.json")
+            downloads = loaded[-1] if isinstance(loaded, tuple) else loaded
+            for path, phone_src, model_name, web_prefix in downloads:
+                BenchmarkOffline._fetch(session, web_prefix + str(phone_src),
+                                        BenchmarkOffline._fixture_file(fixtures, vendor, str(phone_src)))
+            print("Recorded " + vendor + ": " + str(len(downloads)) + " images")
+
+    @staticmethod
+    def _fetch(session, url, path_to_file):
+        os.makedirs(os.path.dirname(path_to_file), exist_ok=True)
+        with session.get(url, timeout=ImageDownloader.TIMEOUT) as response:
+            response.raise_for_status()
+            with open(path_to_file, "wb") as f:
+                f.write(response.content)
+
+    @staticmethod
+    def run_vendor(vendor, port, work_dir, workers):
+        # runs in its own process, the relative paths of the vendor main end up in work_dir
+        vendor_class = BenchmarkOffline._vendor_class(vendor)
+        vendor_class.URL = BenchmarkOffline._local_prefix(port, vendor) + BenchmarkOffline.PAGE_FILE_NAME
+        vendor_class.IMAGE_URL_PREFIX = BenchmarkOffline._local_prefix(port, vendor)
+        GooglePlayDeviceList.URL = "http://127.0.0.1:" + str(port) + "/" + BenchmarkOffline.DEVICE_LIST_FILE_NAME
+        os.chdir(work_dir)
+        ImageCache.configure(os.path.join(work_dir, "cache", "images"))
+        PipelineMetrics.keep_samples(True)
+        PipelineMetrics.reset()
+        start = time.perf_counter()
+        vendor_class.main(workers=workers, db_path="output/", db_file_name="nfc_positions.json",
+                          analysis_cache_dir=os.path.join(work_dir, "cache", "analysis"),
+                          device_list_cache_dir=os.path.join(work_dir, "cache"))
+        wall_seconds = time.perf_counter() - start
+        entries = []
+        if os.path.exists("output/nfc_positions.json"):
+            with open("output/nfc_positions.json", "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        metrics = PipelineMetrics.report()
+        # reported by the workers themselves, None if the images were analyzed in this process
+        return {"vendor": vendor, "wall_seconds": wall_seconds, "metrics": metrics, "entries": entries,
+                "peak_rss_mb": PipelineMetrics.peak_rss_mb(),
+                "peak_rss_workers_mb": metrics["maxima"].get("worker_peak_rss_mb")}
+
+    @staticmethod
+    def iou(box, other_box):
+        x0, x1 = sorted((box["x0"], box["x1"]))
+        y0, y1 = sorted((box["y0"], box["y1"]))
+        other_x0, other_x1 = sorted((other_box["x0"], other_box["x1"]))
+        other_y0, other_y1 = sorted((other_box["y0"], other_box["y1"]))
+        intersection = max(0.0, min(x1, other_x1) - max(x0, other_x0)) * max(0.0, min(y1, other_y1) -
+                                                                             max(y0, other_y0))
+        union = (x1 - x0) * (y1 - y0) + (other_x1 - other_x0) * (other_y1 - other_y0) - intersection
+        return intersection / union if union > 0 else 0.0
+
+    @staticmethod
+    def compare(vendor, entries, ground_truth):
+        manufacturer = BenchmarkOffline.VENDORS[vendor][2]
+        expected = {entry["marketingName"]: entry["nfcPos"] for entry in ground_truth
+                    if entry["manufacturer"] == manufacturer}
+        ious = [BenchmarkOffline.iou(entry["nfcPos"], expected[entry["marketingName"]]) for entry in entries
+                if entry["marketingName"] in expected]
+        return {"compared": len(ious), "not_in_ground_truth": len(entries) - len(ious),
+                "mean_iou": sum(ious) / len(ious) if len(ious) > 0 else None,
+                "iou_at_least_0_5": sum(1 for iou in ious if iou >= 0.5)}
+
+    @staticmethod
+    def _serve(fixtures):
+        handler = partial(_QuietHandler, directory=fixtures)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Offline end to end benchmark of the vendor pipelines")
+        parser.add_argument("fixtures", nargs="?", default=os.path.join("benchmarks", "fixtures"))
+        parser.add_argument("--vendors", nargs="+", choices=sorted(BenchmarkOffline.VENDORS))
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--ground-truth", default=os.path.join(BenchmarkOffline.REPOSITORY, "nfcChipsOutput",
+                                                                   "nfc_positions.json"))
+        parser.add_argument("--json", help="write the full reports into this file")
+        parser.add_argument("--record", action="store_true", help="save the live vendor sites as fixtures")
+        parser.add_argument("--child", choices=sorted(BenchmarkOffline.VENDORS), help=argparse.SUPPRESS)
+        parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+        parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+        args = parser.parse_args(arguments)
+        fixtures = os.path.abspath(args.fixtures)
+        if args.child:
+            print(json.dumps(BenchmarkOffline.run_vendor(args.child, args.port, args.work_dir, args.workers)))
+            return True
+        vendors = args.vendors or [vendor for vendor in sorted(BenchmarkOffline.VENDORS)
+                                   if os.path.exists(os.path.join(fixtures, vendor, BenchmarkOffline.PAGE_FILE_NAME))]
+        if args.record:
+            BenchmarkOffline.record(fixtures, args.vendors or ["samsung", "google"])
+            return True
+        if len(vendors) == 0:
+            print("Error: No fixtures found in " + fixtures + ", record them with --record")
+            return False
+        with open(args.ground_truth, "r", encoding="utf-8") as f:
+            ground_truth = json.load(f)
+        server = BenchmarkOffline._serve(fixtures)
+        reports = {}
+        try:
+            for vendor in vendors:
+                with tempfile.TemporaryDirectory() as work_dir:
+                    output = subprocess.run([sys.executable, os.path.abspath(__file__), fixtures, "--child", vendor,
+                                             "--port", str(server.server_address[1]), "--work-dir", work_dir,
+                                             "--workers", str(args.workers)],
+                                            check=True, capture_output=True, text=True).stdout
+                report = json.loads(output.strip().splitlines()[-1])
+                report["ground_truth"] = BenchmarkOffline.compare(vendor, report["entries"], ground_truth)
+                reports[vendor] = report
+        finally:
+            server.shutdown()
+        for vendor, report in reports.items():
+            latency = report["metrics"]["spans"].get("image_latency", {})
+            comparison = report["ground_truth"]
+            print(vendor + ": " + str(report["metrics"]["counters"].get("images", 0)) + " images, " +
+                  str(len(report["entries"])) + " entries in " + str(round(report["wall_seconds"], 2)) + "s")
+            print("    latency per image p50/p90/p99: " +
+                  "/".join(str(round(latency.get(key, 0.0), 3)) for key in ["p50_seconds", "p90_seconds",
+                                                                             "p99_seconds"]) + "s")
+            workers_rss = report["peak_rss_workers_mb"]
+            print("    peak RSS " + str(report["peak_rss_mb"]) + " MB" +
+                  (", workers " + str(workers_rss) + " MB" if workers_rss is not None else ""))
+            mean_iou = comparison["mean_iou"]
+            print("    IoU with ground truth: " + str(comparison["compared"]) + " compared, mean " +
+                  (str(round(mean_iou, 3)) if mean_iou is not None else "-") + ", " +
+                  str(comparison["iou_at_least_0_5"]) + " >= 0.5, " + str(comparison["not_in_ground_truth"]) +
+                  " not in ground truth")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(reports, f, indent=2)
+        return True
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    if not BenchmarkOffline.main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,74 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from analysisCache import AnalysisCache
+from renderGroups import RenderGroups
+from runNfcLocalization import RunNfcLocalization
+
+"""
+Groups the images of a folder like the pipeline does (RenderGroups) and lists every group with more than one image.
+With --vendor every image is also analyzed on its own and the analysis time of all images is compared with the time
+of the representatives plus the hashing.
+Usage: python benchmarks/benchmarkRenderDedup.py samsung/phones/ [--vendor samsung]
+"""
+class BenchmarkRenderDedup:
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Identical render groups of an image folder")
+        parser.add_argument("folder")
+        parser.add_argument("--vendor", choices=["samsung", "huawei"], help="also compare the analysis time")
+        args = parser.parse_args(arguments)
+        groups = RenderGroups()
+        members = {}
+        start = time.perf_counter()
+        file_names = sorted(os.listdir(args.folder))
+        for file_name in file_names:
+            representative = groups.add(file_name, AnalysisCache.key_of(os.path.join(args.folder, file_name)))
+            members.setdefault(representative or file_name, []).append(file_name)
+        hash_seconds = time.perf_counter() - start
+        print(str(len(file_names)) + " images, " + str(len(members)) + " groups, hashing " +
+              str(round(hash_seconds * 1000 / max(1, len(file_names)), 2)) + " ms per image")
+        for representative, group in members.items():
+            if len(group) > 1:
+                print("  " + representative + ": " + ", ".join(group[1:]))
+        if args.vendor is None:
+            return True
+        vendor_class = RunNfcLocalization.vendor_class(args.vendor)
+        seconds = {}
+        for file_name in file_names:
+            start = time.perf_counter()
+            vendor_class._analyze_image(args.folder, file_name)
+            seconds[file_name] = time.perf_counter() - start
+        all_seconds = sum(seconds.values())
+        dedup_seconds = sum(seconds[representative] for representative in members) + hash_seconds
+        print("analysis of all images " + str(round(all_seconds, 2)) + " s, of the representatives with hashing " +
+              str(round(dedup_seconds, 2)) + " s (" + str(round(all_seconds / max(dedup_seconds, 1e-9), 2)) + "x)")
+        return True
+
+
+if __name__ == "__main__":
+    BenchmarkRenderDedup.main(sys.argv[1:])
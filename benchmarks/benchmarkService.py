@@ -0,0 +1,118 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+import requests
+from urllib.parse import urlsplit, urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from benchmarkLookup import BenchmarkLookup
+
+"""
+Load test of a running service (runNfcLocalization.py --serve): sends the lookup mix of benchmarkLookup.py (model
+names, marketing names, model names with a suffix, unknown names) from several threads over keep-alive connections and
+reports throughput and latency percentiles - the clients share the GIL, run them on another host or core for the
+full throughput of the service. With --refresh an update of the vendor is requested first, so the lookups are measured
+while it runs.
+Usage: python benchmarks/benchmarkService.py [--url http://127.0.0.1:8080] [--requests 20000] [--concurrency 8]
+       [--refresh samsung]
+"""
+class BenchmarkService:
+    @staticmethod
+    def _percentile(latencies, fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+    @staticmethod
+    def _client(url, queries, latencies, statuses, lock):
+        # http.client instead of requests, its overhead per request is several times the lookup
+        url = urlsplit(url)
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+        own_latencies = []
+        own_statuses = {}
+        for query in queries:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", "/lookup?" + urlencode({"model": query}))
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = "error"
+            own_latencies.append(time.perf_counter() - start)
+            own_statuses[status] = own_statuses.get(status, 0) + 1
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            for status, count in own_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    @staticmethod
+    def main(arguments):
+        parser = argparse.ArgumentParser(description="Lookup latency and throughput of the nfc position service")
+        parser.add_argument("database", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                        "..", "nfcChipsOutput", "nfc_positions.json"),
+                            help="the model names of the queries are taken from this file")
+        parser.add_argument("--url", default="http://127.0.0.1:8080")
+        parser.add_argument("--requests", type=int, default=20000)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--refresh", metavar="VENDOR", help="request an update of the vendor before the test")
+        args = parser.parse_args(arguments)
+        with open(args.database, "r", encoding="utf-8") as f:
+            queries = BenchmarkLookup._queries(json.load(f), args.requests)
+        if args.refresh is not None:
+            response = requests.post(args.url + "/refresh", params={"vendor": args.refresh}, timeout=10)
+            print("refresh " + args.refresh + ": " + str(response.status_code) + " " + response.text)
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        threads = [threading.Thread(target=BenchmarkService._client,
+                                    args=(args.url, queries[i::args.concurrency], latencies, statuses, lock))
+                   for i in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - start
+        latencies.sort()
+        print(str(len(latencies)) + " lookups from " + str(args.concurrency) + " clients in " +
+              str(round(wall_seconds, 2)) + " s: " + str(round(len(latencies) / wall_seconds)) + " lookups/s")
+        print("latency: median " + str(round(BenchmarkService._percentile(latencies, 0.5) * 1000, 2)) + " ms, p90 " +
+              str(round(BenchmarkService._percentile(latencies, 0.9) * 1000, 2)) + " ms, p99 " +
+              str(round(BenchmarkService._percentile(latencies, 0.99) * 1000, 2)) + " ms, max " +
+              str(round(latencies[-1] * 1000, 2)) + " ms")
+        print("responses: " + ", ".join(str(status) + ": " + str(count) for status, count in sorted(
+            statuses.items(), key=lambda item: str(item[0]))))
+        status = requests.get(args.url + "/status", timeout=10).json()
+        print("service: " + str(status["entries"]) + " entries, updating " + str(status["refreshing"]) +
+              ", last updates " + json.dumps(status["refreshes"]))
+        return "error" not in statuses
+
+
+if __name__ == "__main__":
+    BenchmarkService.main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import io
+import time
+import contextlib
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from findNfcChipForSamsung import FindNfcChipForSamsung
+
+"""
+Regression harness for FindNfcChipForSamsung._find_nfc_chip_via_color: runs the original full HSV sweep with
+pairwise cv.matchShapes next to the current implementation on every image of a folder, reports both run times and
+fails if a single box differs.
+Usage: python benchmarks/verifySamsungColorSweep.py [image folder, default: samsung/phones/]
+"""
+class VerifySamsungColorSweep:
+    @staticmethod
+    def _reference_find_nfc_chip_via_color(img):
+        hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+        dim = img.shape
+        pixel_image = dim[0] * dim[1]
+        for sat in range(50, 11, -1):
+            for hue in range(98, 102):
+                lower_range = np.array([80, sat, 20])
+                upper_range = np.array([hue, 255, 255])
+                mask = cv.inRange(hsv, lower_range, upper_range)
+                contours, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
+                big_contours = [contour for contour in contours if cv.contourArea(contour) > 500]
+                if len(big_contours) != 0:
+                    x0, y0, x1, y1 = VerifySamsungColorSweep._reference_check_contours(big_contours, pixel_image)
+                    if x0 != -1:
+                        return x0, y0, x1, y1
+        return -1, -1, -1, -1
+
+    @staticmethod
+    def _reference_check_contours(contours, pixel_image):
+        min_match_val = 0.1
+        for contour in contours:
+            for contour_to_check in contours:
+                matching_value = cv.matchShapes(contour_to_check, contour, 1, 0.0)
+                if (matching_value < min_match_val) & (matching_value != 0.0):
+                    min_match_val = matching_value
+                    peri = cv.arcLength(contour, True)
+                    approx = cv.approxPolyDP(contour, 0.02 * peri, True)
+                    x0, y0, w, h = cv.boundingRect(approx)
+                    if (w * h / pixel_image) < 0.5:
+                        return x0, y0, (x0 + w), (y0 + h)
+        return -1, -1, -1, -1
+
+    @staticmethod
+    def main(folder):
+        reference_seconds = 0.0
+        current_seconds = 0.0
+        checked = 0
+        differences = 0
+        for file_name in sorted(os.listdir(folder)):
+            img = cv.imread(os.path.join(folder, file_name))
+            if img is None:
+                continue
+            start = time.perf_counter()
+            reference_box = VerifySamsungColorSweep._reference_find_nfc_chip_via_color(img)
+            reference_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                current_box = FindNfcChipForSamsung._find_nfc_chip_via_color(img, file_name)
+            current_seconds += time.perf_counter() - start
+            checked += 1
+            if tuple(reference_box) != tuple(current_box):
+                differences += 1
+                print("Difference for " + file_name + ": " + str(reference_box) + " != " + str(current_box))
+        print("Images: " + str(checked) + ", differences: " + str(differences))
+        print("Reference: " + str(round(reference_seconds, 3)) + "s, current: " + str(round(current_seconds, 3)) +
+              "s, speedup: " + str(round(reference_seconds / current_seconds, 2) if current_seconds > 0 else "-") + "x")
+        return differences == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if VerifySamsungColorSweep.main(sys.argv[1] if len(sys.argv) > 1 else "samsung/phones/") else 1)
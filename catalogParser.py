@@ -0,0 +1,86 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import importlib.util
+from collections import namedtuple
+from bs4 import BeautifulSoup as bs, SoupStrainer
+
+# name and image source as on the page, features are the texts of the feature list (Google only)
+PhoneRecord = namedtuple("PhoneRecord", ["name", "image_src", "features"])
+
+"""
+CatalogParser extracts the phones of the vendor pages. Only the elements holding the phones are parsed (SoupStrainer),
+with lxml if it is installed, and every phone is returned as PhoneRecord of plain strings - the parse tree is dropped
+right away.
+"""
+class CatalogParser:
+    _parser = None
+
+    @staticmethod
+    def parser():
+        # lxml is optional, html.parser is part of python
+        if CatalogParser._parser is None:
+            CatalogParser._parser = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+        return CatalogParser._parser
+
+    @staticmethod
+    def _parse(content, name, class_name, parser=None):
+        return bs(content, parser or CatalogParser.parser(), parse_only=SoupStrainer(name, class_=class_name))
+
+    @staticmethod
+    def samsung_phones(content, parser=None):
+        soup = CatalogParser._parse(content, 'div', 'phone-item', parser)
+        records = []
+        for phone in soup.find_all('div', class_='phone-item'):
+            records.append(PhoneRecord(str(phone.find('div', class_='sm-text').text).strip(),
+                                       str(phone.find('img', class_='product')["src"]), ()))
+        soup.decompose()
+        return records
+
+    @staticmethod
+    def google_phones(content, parser=None):
+        soup = CatalogParser._parse(content, 'div', 'cc', parser)
+        content = soup.find('div', class_='cc')
+        if content is None:
+            print("Error: No phone list found on the Google page")
+            return []
+        model_names = content.find_all(class_='zippy')
+        feature_lists = content.find_all('ol')
+        images = content.find_all('img', class_='')
+        records = []
+        for img, model_name, feature_list in zip(images, model_names, feature_lists):
+            records.append(PhoneRecord(str(model_name.text), str(img["src"]),
+                                       tuple(str(feature.text) for feature in feature_list.find_all('li'))))
+        soup.decompose()
+        return records
+
+    @staticmethod
+    def huawei_phones(content, parser=None):
+        soup = CatalogParser._parse(content, 'div', 'nfc', parser)
+        dropdown = soup.find('div', class_='nfc')
+        if dropdown is None:
+            print("Error: No phone list found on the Huawei page")
+            return []
+        phones = dropdown.select('option')
+        phones.pop(0)  # delete empty image
+        records = [PhoneRecord(phone.text.strip(), phone.get('value'), ()) for phone in phones]
+        soup.decompose()
+        return records
@@ -24,39 +24,59 @@ import cv2 as cv
 from baselineFunctions import BaselineFunctions as base
 import requests
 import os
-from bs4 import BeautifulSoup as bs
-import easyocr
+import functools
+from catalogParser import CatalogParser
+from vendorCatalog import VendorCatalog
+from ocrReaderPool import OcrReaderPool as ocr
+from analysisCache import AnalysisCache
+from nfcPipeline import NfcPipeline
+from pipelineMetrics import PipelineMetrics
+from parallelAnalysis import ParallelAnalysis
 
 
 class FindNfcChipForGoogle:
+    # bump when the results of the detection change, cached analysis results are dropped then
+    DETECTOR_VERSION = "2"
+    # vendor page and the prefix of its image sources, e.g. replaced by a local server for benchmarks
+    URL = 'https://support.google.com/pixelphone/answer/7157629?hl=de#zippy&zippy='
+    IMAGE_URL_PREFIX = 'https:'
+    # number of images per batched text detection, 1 analyzes every image on its own
+    OCR_BATCH_SIZE = 8
+    # > 0 finds the phone edge on the image downscaled this many times (cv.pyrDown) and refines it at full resolution
+    EDGE_PYRAMID_LEVELS = 0
+
     @staticmethod
-    def _load_all_new_phone_images(url, image_path, db_path, db_file_name):
+    def _load_all_new_phone_images(url, image_path, db_path, db_file_name, catalog=None):
         if not os.path.isdir(image_path):
             os.makedirs(image_path)
 
-        website = requests.get(url)
-        results = bs(website.content, 'html.parser')
-        content = results.find('div', class_='cc')
-        model_names = content.findAll(class_='zippy')
-        feature_lists = content.findAll('ol')
-        images = content.findAll('img', class_='')
+        if catalog is None:
+            phones = CatalogParser.google_phones(requests.get(url).content)
+        else:
+            # nothing to parse if the page was not modified
+            content = catalog.fetch(url)
+            phones = CatalogParser.google_phones(content) if content is not None else []
 
         nfc_feature_numbers = []
         marketing_names = []
-        for img, model_name, feature_list in zip(images, model_names, feature_lists):
-            img_src = img["src"]
-            model_name = FindNfcChipForGoogle._get_model_name(model_name.text)
-            feature_number = FindNfcChipForGoogle._get_nfc_feature_number(feature_list)
+        downloads = []
+        for model_name, img_src, features in phones:
+            model_name = FindNfcChipForGoogle._get_model_name(model_name)
+            feature_number = FindNfcChipForGoogle._get_nfc_feature_number(features)
+            if catalog is not None:
+                catalog.add(model_name, img_src, feature_number)
             if feature_number == -1:
                 print('No nfc-feature for' + model_name)
+                if catalog is not None:
+                    catalog.set_state(model_name, VendorCatalog.NO_FEATURE)
                 continue
             nfc_feature_numbers.append(feature_number)
             marketing_names.append(model_name)
-            if not base.check_if_data_base_entry_exists(db_path, db_file_name, model_name):
-                base.download_image(image_path, img_src, model_name, 'https:')
+            if base.needs_analysis(db_path, db_file_name, model_name, catalog):
+                downloads.append((image_path, img_src, model_name, FindNfcChipForGoogle.IMAGE_URL_PREFIX))
             else:
                 print("Existing database entry found for: " + model_name)
-        return nfc_feature_numbers, marketing_names
+        return nfc_feature_numbers, marketing_names, downloads
 
     @staticmethod
     def _get_model_name(model_name):
@@ -65,16 +85,26 @@ class FindNfcChipForGoogle:
         return model_name[pos:len(model_name)] if pos != -1 else model_name
 
     @staticmethod
-    def _get_nfc_feature_number(feature_list):
-        feature_list = feature_list.findAll('li')
-        for i, feature in enumerate(feature_list, start=1):
-            if "NFC" in str(feature.text).upper():
+    def _get_nfc_feature_number(features):
+        # features are the texts of the numbered feature list
+        for i, feature in enumerate(features, start=1):
+            if "NFC" in feature.upper():
                 return i
         return -1
 
     @staticmethod
-    def _find_phone_edge_in_image(img, file_name):
-        dim = img.shape
+    def _find_phone_edge_in_image(img, file_name, levels=None):
+        levels = levels if levels is not None else FindNfcChipForGoogle.EDGE_PYRAMID_LEVELS
+        if levels > 0:
+            # light or dark is decided on the whole image, not per strip
+            invert = np.mean(img) > 125
+            return base.find_phone_edge_coarse_to_fine(
+                img, lambda img_small: FindNfcChipForGoogle._find_phone_edge_at_resolution(img_small, file_name),
+                lambda strip: FindNfcChipForGoogle._edge_map(strip, invert), levels)
+        return FindNfcChipForGoogle._find_phone_edge_at_resolution(img, file_name)
+
+    @staticmethod
+    def _edge_map(img, invert):
         # Preprocessing
         # convert BGR to HSV
         img_hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
@@ -89,12 +119,17 @@ class FindNfcChipForGoogle:
         # blur
         img_blur = cv.GaussianBlur(img_gray, (1, 1), cv.BORDER_DEFAULT)
         # inverse if light image
-        if np.mean(img) > 125:
+        if invert:
             img = cv.bitwise_not(img_blur)
         # filter all colors
         res = cv.bitwise_and(img, img, mask=mask)
         # edge detection
-        img_canny = cv.Canny(res, 0, 10)
+        return cv.Canny(res, 0, 10)
+
+    @staticmethod
+    def _find_phone_edge_at_resolution(img, file_name):
+        dim = img.shape
+        img_canny = FindNfcChipForGoogle._edge_map(img, np.mean(img) > 125)
         # merge edges
         img_dil = cv.dilate(img_canny, (3, 3), iterations=1)
         img_ero = cv.erode(img_dil, (3, 3), iterations=1)
@@ -109,9 +144,8 @@ class FindNfcChipForGoogle:
                     x0, y0, w, h = cv.boundingRect(approx)
                     if x0 >= dim[1] / 2:  # contour is on the right side
                         return x0, y0, (x0 + w), (y0 + h)
-        else:
-            print("Could not find edge for " + file_name)
-            return -1, -1, -1, -1
+        print("Could not find edge for " + file_name)
+        return -1, -1, -1, -1
 
     @staticmethod
     def _find_nfc_chip_via_feature_number(img, file_name, feature_number):
@@ -121,9 +155,16 @@ class FindNfcChipForGoogle:
         # inverse if light image
         if np.mean(img) < 125:
             img_gray = cv.bitwise_not(img_gray)
-        scaled_img = cv.resize(img_gray, None, fx=4.0, fy=4.0, interpolation=cv.INTER_LINEAR)
-        x0_num, y0_num, x1_num, y1_num = FindNfcChipForGoogle._find_number_on_img_with_ocr(scaled_img, feature_number)
-        x0, y0, x1, y1 = FindNfcChipForGoogle._find_nfc_chip_near_number_coordinates(img, x0_num, y0_num, x1_num, y1_num)
+        annotation_boxes = FindNfcChipForGoogle._find_annotation_boxes(img)
+        # the number belongs to one of the blue annotations -> only read these regions first
+        x0_num, y0_num, x1_num, y1_num = FindNfcChipForGoogle._find_number_in_regions(img_gray, annotation_boxes,
+                                                                                       feature_number)
+        if x0_num == -1:
+            scaled_img = cv.resize(img_gray, None, fx=4.0, fy=4.0, interpolation=cv.INTER_LINEAR)
+            x0_num, y0_num, x1_num, y1_num = FindNfcChipForGoogle._find_number_on_img_with_ocr(scaled_img,
+                                                                                               feature_number)
+        x0, y0, x1, y1 = FindNfcChipForGoogle._find_nfc_chip_near_number_coordinates(annotation_boxes, x0_num, y0_num,
+                                                                                     x1_num, y1_num)
         if x0 != -1:
             return x0, y0, x1, y1
         else:
@@ -131,7 +172,7 @@ class FindNfcChipForGoogle:
             return -1, -1, -1, -1
 
     @staticmethod
-    def _find_nfc_chip_near_number_coordinates(img, x0_num, y0_num, x1_num, y1_num):
+    def _find_annotation_boxes(img):
         # Preprocessing
         # convert BGR to HSV
         img_hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
@@ -144,49 +185,97 @@ class FindNfcChipForGoogle:
         img_dil = cv.dilate(img_canny, (3, 3), iterations=2)
         # contour detection
         contours, hierarchies = cv.findContours(img_dil, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+        annotation_boxes = []
         for contour in contours:
             if cv.contourArea(contour) > 100:
                 peri = cv.arcLength(contour, True)
                 approx = cv.approxPolyDP(contour, 0.02 * peri, True)
-                x0, y0, w, h = cv.boundingRect(approx)
-                x1, y1 = x0 + w, y0 + h
-                # find corresponding contour to the pos of the number with 5% deviation
-                if x0 * 0.95 <= x0_num and y0 * 0.95 <= y0_num and x1 * 1.05 >= x1_num and y1 * 1.05 >= y1_num:
-                    nfc_chip_size = w if w < h else h
-                    # number is on the top-left - nfc chip on opposite side of contour
-                    if x0 - x0_num <= x1 - x1_num & y0 - y0_num <= y1 - y1_num:
-                        return x1 - nfc_chip_size, y1 - nfc_chip_size, x1, y1
-                    # number is on the bottom-left - nfc chip on opposite side of contour
-                    elif x0 - x0_num <= x1 - x1_num & y0 - y0_num >= y1 - y1_num:
-                        return x1 - nfc_chip_size, y0, x1, y0 + nfc_chip_size
-                    # number is on the top-right - nfc chip on opposite side of contour
-                    elif x0 - x0_num >= x1 - x1_num & y0 - y0_num <= y1 - y1_num:
-                        return x0, y1 - nfc_chip_size, x0 + nfc_chip_size, y1
-                    # number is on the bottom-right - nfc chip on opposite side of contour
-                    else:
-                        return x0, y0, x0 + nfc_chip_size, y0 + nfc_chip_size
+                annotation_boxes.append(cv.boundingRect(approx))
+        return annotation_boxes
+
+    @staticmethod
+    def _get_number_regions(annotation_boxes, width, height, margin=10):
+        # area in which _find_nfc_chip_near_number_coordinates accepts a number for an annotation (5% deviation)
+        number_regions = []
+        for x0, y0, w, h in annotation_boxes:
+            x1, y1 = x0 + w, y0 + h
+            number_regions.append((max(0, int(x0 * 0.95) - margin), max(0, int(y0 * 0.95) - margin),
+                                   min(width, int(x1 * 1.05) + margin), min(height, int(y1 * 1.05) + margin)))
+        return number_regions
+
+    @staticmethod
+    def _find_number_in_regions(img_gray, annotation_boxes, feature_number):
+        height, width = img_gray.shape[:2]
+        for x0_reg, y0_reg, x1_reg, y1_reg in FindNfcChipForGoogle._get_number_regions(annotation_boxes, width,
+                                                                                       height):
+            # only the small region is scaled up for the text detection
+            scaled_region = cv.resize(img_gray[y0_reg:y1_reg, x0_reg:x1_reg], None, fx=4.0, fy=4.0,
+                                      interpolation=cv.INTER_LINEAR)
+            x0_num, y0_num, x1_num, y1_num = FindNfcChipForGoogle._find_number_on_img_with_ocr(scaled_region,
+                                                                                               feature_number)
+            if x0_num != -1:
+                return x0_num + x0_reg, y0_num + y0_reg, x1_num + x0_reg, y1_num + y0_reg
+        return -1, -1, -1, -1
+
+    @staticmethod
+    def _find_nfc_chip_near_number_coordinates(annotation_boxes, x0_num, y0_num, x1_num, y1_num):
+        for x0, y0, w, h in annotation_boxes:
+            x1, y1 = x0 + w, y0 + h
+            # find corresponding contour to the pos of the number with 5% deviation
+            if x0 * 0.95 <= x0_num and y0 * 0.95 <= y0_num and x1 * 1.05 >= x1_num and y1 * 1.05 >= y1_num:
+                nfc_chip_size = w if w < h else h
+                # number is on the top-left - nfc chip on opposite side of contour
+                if x0 - x0_num <= x1 - x1_num & y0 - y0_num <= y1 - y1_num:
+                    return x1 - nfc_chip_size, y1 - nfc_chip_size, x1, y1
+                # number is on the bottom-left - nfc chip on opposite side of contour
+                elif x0 - x0_num <= x1 - x1_num & y0 - y0_num >= y1 - y1_num:
+                    return x1 - nfc_chip_size, y0, x1, y0 + nfc_chip_size
+                # number is on the top-right - nfc chip on opposite side of contour
+                elif x0 - x0_num >= x1 - x1_num & y0 - y0_num <= y1 - y1_num:
+                    return x0, y1 - nfc_chip_size, x0 + nfc_chip_size, y1
+                # number is on the bottom-right - nfc chip on opposite side of contour
+                else:
+                    return x0, y0, x0 + nfc_chip_size, y0 + nfc_chip_size
         return -1, -1, -1, -1
 
     @staticmethod
     def _find_number_on_img_with_ocr(scaled_img, feature_number):
-        # init textdetection
-        reader = easyocr.Reader(['en'], gpu=False)
-        result_list = reader.readtext(scaled_img, allowlist='0123456789')
+        # textdetection with the shared reader
+        result_list = ocr.read_text(scaled_img, allowlist='0123456789')
+        x0, y0, x1, y1 = FindNfcChipForGoogle._get_number_location(result_list, feature_number)
+        if x0 == -1:  # if text detection did not find the number -> try with sharpened image
+            result_list = ocr.read_text(FindNfcChipForGoogle._sharpen(scaled_img), allowlist='0123456789')
+            x0, y0, x1, y1 = FindNfcChipForGoogle._get_number_location(result_list, feature_number)
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def _find_numbers_on_imgs_with_ocr(scaled_imgs, feature_numbers, ocr_batch_size):
+        # same as _find_number_on_img_with_ocr, but the text detection runs in batches over all images
+        result_lists = ocr.read_text_batched(scaled_imgs, allowlist='0123456789', batch_size=ocr_batch_size)
+        number_locations = [FindNfcChipForGoogle._get_number_location(result_list, feature_number)
+                            for result_list, feature_number in zip(result_lists, feature_numbers)]
+        # retry the images without the number sharpened
+        retry = [i for i, number_location in enumerate(number_locations) if number_location[0] == -1]
+        if len(retry) > 0:
+            result_lists = ocr.read_text_batched([FindNfcChipForGoogle._sharpen(scaled_imgs[i]) for i in retry],
+                                                 allowlist='0123456789', batch_size=ocr_batch_size)
+            for i, result_list in zip(retry, result_lists):
+                number_locations[i] = FindNfcChipForGoogle._get_number_location(result_list, feature_numbers[i])
+        return number_locations
+
+    @staticmethod
+    def _sharpen(scaled_img):
+        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+        return cv.filter2D(scaled_img, -1, kernel)
+
+    @staticmethod
+    def _get_number_location(result_list, feature_number):
         number_locations = []
         for result in result_list:
             if (result[1] == str(feature_number)) & (result[2] >= 0.8):  # found the right Number with 80% plausibility
                 number_locations.append(result)
-        if len(number_locations) == 0:  # if text detection did not find the number -> try with sharpened image
-            # sharpen image
-            kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-            sharpened_img = cv.filter2D(scaled_img, -1, kernel)
-            result_list = reader.readtext(sharpened_img, allowlist='0123456789')
-            for result in result_list:
-                if (result[1] == str(feature_number)) & (
-                        result[2] >= 0.8):  # found the right Number with 80% plausibility
-                    number_locations.append(result)
-
-        if number_locations is not None and len(number_locations) > 0:
+
+        if len(number_locations) > 0:
             sorted(number_locations, key=lambda x: x[2], reverse=True)  # highest plausibility at pos[0]
             x0 = int(number_locations[0][0][0][0] / 4)
             y0 = int(number_locations[0][0][0][1] / 4)
@@ -200,9 +289,7 @@ class FindNfcChipForGoogle:
     def _get_model_names_of_device_list(google_device_list, file_name):
         full_name = file_name.split(".")[0]
         marketing_name = full_name.split(" (2")[0]
-        return google_device_list.loc[
-            (google_device_list['Retail Branding'] == "Google") &
-            (google_device_list['Marketing Name'] == marketing_name)]['Model'].values.tolist()
+        return google_device_list.get_models("Google", marketing_name)
 
     @staticmethod
     def _find_feature_number_for_model(nfc_feature_numbers, marketing_names, file_name):
@@ -214,31 +301,138 @@ class FindNfcChipForGoogle:
         return -1
 
     @staticmethod
-    def main():
-        nfc_feature_numbers, marketing_names = FindNfcChipForGoogle._load_all_new_phone_images(
-            'https://support.google.com/pixelphone/answer/7157629?hl=de#zippy&zippy=', 'google/phones/',
-            'nfcChipsOutput/', 'nfc_positions.json')
-        images, file_names = base.load_all_images_of_folder('google/phones/')
-        google_device_list = base.load_google_play_device_list()
-        nfc_chip_locations = []
-        for img, file_name in zip(images, file_names):
-            feature_number = FindNfcChipForGoogle._find_feature_number_for_model(nfc_feature_numbers, marketing_names,
-                                                                                 file_name)
-            x0_nfc, y0_nfc, x1_nfc, y1_nfc = FindNfcChipForGoogle._find_nfc_chip_via_feature_number(img, file_name,
-                                                                                                    feature_number)
-            x0_edge, y0_edge, x1_edge, y1_edge = FindNfcChipForGoogle._find_phone_edge_in_image(img, file_name)
-            if x0_edge != -1 & x0_nfc != -1:
-                x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
-                                                                      x1_edge, y1_edge)
-                nfc_chip_locations.append(
-                    base.format_coordinates("Google", file_name,
-                                            FindNfcChipForGoogle._get_model_names_of_device_list(google_device_list,
-                                                                                                 file_name),
-                                            x0, y0, x1, y1))
-            else:
-                print("Missing or Wrong Parameter to find the right Coordinates for: " + file_name)
+    def _analyze_image(folder, file_name, feature_number, edge_pyramid_levels=None):
+        img = base.load_image(os.path.join(folder, file_name))
+        if img is None:
+            return None
+        with PipelineMetrics.span("chip_detection"):
+            nfc_box = FindNfcChipForGoogle._find_nfc_chip_via_feature_number(img, file_name, feature_number)
+        with PipelineMetrics.span("edge_detection"):
+            edge_box = FindNfcChipForGoogle._find_phone_edge_in_image(img, file_name, edge_pyramid_levels)
+        return nfc_box, edge_box
 
-        base.write_to_json_file(nfc_chip_locations, 'nfcChipsOutput/', 'nfc_positions.json')
-        base.delete_all_files_in_folder("google/phones/")
+    @staticmethod
+    def _prepare_image(folder, file_name, edge_pyramid_levels=None):
+        # everything of the detection except the text detection
+        img = base.load_image(os.path.join(folder, file_name))
+        if img is None:
+            return None
+        with PipelineMetrics.span("edge_detection"):
+            edge_box = FindNfcChipForGoogle._find_phone_edge_in_image(img, file_name, edge_pyramid_levels)
+        img_gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+        if np.mean(img) < 125:
+            img_gray = cv.bitwise_not(img_gray)
+        with PipelineMetrics.span("annotation_detection"):
+            annotation_boxes = FindNfcChipForGoogle._find_annotation_boxes(img)
+        return edge_box, annotation_boxes, img_gray
+
+    @staticmethod
+    def _analyze_images_batched(tasks, executor, ocr_batch_size, edge_pyramid_levels=None):
+        # the images are prepared in parallel on the executor (in this process without), the text detection of the
+        # annotation regions of all images runs batched in this process
+        prepared = ParallelAnalysis.map_images(FindNfcChipForGoogle._prepare_image,
+                                               [(file_name, (folder, file_name, edge_pyramid_levels))
+                                                for folder, file_name, _ in tasks], executor=executor)
+        number_locations = [(-1, -1, -1, -1)] * len(tasks)
+        # first the regions around the annotations of all images
+        regions = []
+        for i, preparation in enumerate(prepared):
+            if preparation is None:
+                continue
+            edge_box, annotation_boxes, img_gray = preparation
+            height, width = img_gray.shape[:2]
+            for x0_reg, y0_reg, x1_reg, y1_reg in FindNfcChipForGoogle._get_number_regions(annotation_boxes, width,
+                                                                                           height):
+                regions.append((i, x0_reg, y0_reg, cv.resize(img_gray[y0_reg:y1_reg, x0_reg:x1_reg], None, fx=4.0,
+                                                             fy=4.0, interpolation=cv.INTER_LINEAR)))
+        region_locations = FindNfcChipForGoogle._find_numbers_on_imgs_with_ocr(
+            [scaled_region for _, _, _, scaled_region in regions], [tasks[i][2] for i, _, _, _ in regions],
+            ocr_batch_size)
+        # the first region with the number counts, like in _find_number_in_regions
+        for (i, x0_reg, y0_reg, _), (x0_num, y0_num, x1_num, y1_num) in zip(regions, region_locations):
+            if x0_num != -1 and number_locations[i][0] == -1:
+                number_locations[i] = (x0_num + x0_reg, y0_num + y0_reg, x1_num + x0_reg, y1_num + y0_reg)
+        del regions
+        # then the whole image of the rest, one at a time as the upscaled images are large - batched they would be
+        # padded to a common size and held together
+        for i, preparation in enumerate(prepared):
+            if preparation is None or number_locations[i][0] != -1:
+                continue
+            scaled_img = cv.resize(preparation[2], None, fx=4.0, fy=4.0, interpolation=cv.INTER_LINEAR)
+            number_locations[i] = FindNfcChipForGoogle._find_number_on_img_with_ocr(scaled_img, tasks[i][2])
+            del scaled_img
+        results = []
+        for (folder, file_name, feature_number), preparation, number_location in zip(tasks, prepared,
+                                                                                      number_locations):
+            if preparation is None:
+                results.append(None)
+                continue
+            edge_box, annotation_boxes, _ = preparation
+            nfc_box = FindNfcChipForGoogle._find_nfc_chip_near_number_coordinates(annotation_boxes, *number_location)
+            if nfc_box[0] == -1:
+                print("Could not find nfc-chip for: " + file_name)
+            results.append((nfc_box, edge_box))
+        return results
+
+    @staticmethod
+    def _to_entry(google_device_list, file_name, result):
+        (x0_nfc, y0_nfc, x1_nfc, y1_nfc), (x0_edge, y0_edge, x1_edge, y1_edge) = result
+        if x0_edge != -1 & x0_nfc != -1:
+            x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
+                                                                  x1_edge, y1_edge)
+            return base.format_coordinates("Google", file_name,
+                                           FindNfcChipForGoogle._get_model_names_of_device_list(google_device_list,
+                                                                                                file_name),
+                                           x0, y0, x1, y1)
+        print("Missing or Wrong Parameter to find the right Coordinates for: " + file_name)
+        return None
+
+    @staticmethod
+    def scrape(db_path, db_file_name, catalog=None):
+        # the downloads of the phones to analyze and the extra arguments of their analysis per file name
+        with PipelineMetrics.span("scrape"):
+            nfc_feature_numbers, marketing_names, downloads = FindNfcChipForGoogle._load_all_new_phone_images(
+                FindNfcChipForGoogle.URL, 'google/phones/', db_path, db_file_name, catalog)
+        # the result depends on the feature number, not only on the image
+        return downloads, lambda file_name: (FindNfcChipForGoogle._find_feature_number_for_model(
+            nfc_feature_numbers, marketing_names, file_name),)
+
+    @staticmethod
+    def main(workers=1, ocr_batch_size=None, db_path='nfcChipsOutput/', db_file_name='nfc_positions.json',
+             analysis_cache_dir=None, device_list_cache_dir=None, dry_run=False, edge_pyramid_levels=None, force=False,
+             catalog_cache_dir=None, compact=False):
+        if edge_pyramid_levels is None:
+            edge_pyramid_levels = FindNfcChipForGoogle.EDGE_PYRAMID_LEVELS
+        catalog = VendorCatalog("Google", db_path, db_file_name, catalog_cache_dir, force)
+        downloads, feature_number_of = FindNfcChipForGoogle.scrape(db_path, db_file_name, catalog)
+        if catalog.unchanged():
+            print("Google: the phones on the vendor page did not change since the last run, skipped")
+            return
+        catalog.print_diff()
+        google_device_list = base.load_google_play_device_list(device_list_cache_dir)
+        if ocr_batch_size is None:
+            ocr_batch_size = FindNfcChipForGoogle.OCR_BATCH_SIZE
+        to_entry = lambda file_name, result: FindNfcChipForGoogle._to_entry(google_device_list, file_name, result)
+        # every image is analyzed and written as soon as it is downloaded (or its batch is complete)
+        pipeline = NfcPipeline(AnalysisCache("Google", base.detector_fingerprint(
+            FindNfcChipForGoogle.DETECTOR_VERSION, edge_pyramid_levels), analysis_cache_dir),
+                               'google/phones/', db_path, db_file_name, dry_run=dry_run, compact=compact)
+        if ocr_batch_size > 1:
+            pipeline.run_batched(downloads, lambda tasks, executor: FindNfcChipForGoogle._analyze_images_batched(
+                tasks, executor, ocr_batch_size, edge_pyramid_levels), to_entry, feature_number_of, ocr_batch_size,
+                                 workers)
+        else:
+            # every worker process loads its own ocr reader once
+            # the level is passed with every image, worker processes do not share the state of this one
+            pipeline.run(downloads, functools.partial(FindNfcChipForGoogle._analyze_image,
+                                                      edge_pyramid_levels=edge_pyramid_levels),
+                         to_entry, feature_number_of, workers)
+        if not dry_run:
+            # the next run compares the vendor page with this one and analyzes the failed phones again
+            catalog.save(pipeline.failed(downloads), pipeline.not_located(downloads))
+        timings = ocr.get_timings()
+        print("OCR: models loaded " + str(timings["load_count"]) + "x in " + str(round(timings["load_seconds"], 2)) +
+              "s, " + str(timings["inference_count"]) + " inferences with avg " +
+              str(round(timings["inference_seconds_avg"], 3)) + "s")
 
 
@@ -19,66 +19,89 @@
 """
 
 
+import heapq
 import numpy as np
 import cv2 as cv
 from baselineFunctions import BaselineFunctions as base
+from analysisCache import AnalysisCache
+from nfcPipeline import NfcPipeline
+from pipelineMetrics import PipelineMetrics
 import requests
 import os
-from bs4 import BeautifulSoup as bs
-import pandas as pd
+import functools
+from catalogParser import CatalogParser
+from vendorCatalog import VendorCatalog
 
 """
 FindNfcChipForHuawei is not working anymore since the website was taken down.
 """
 class FindNfcChipForHuawei:
+    # bump when the results of the detection change, cached analysis results are dropped then
+    DETECTOR_VERSION = "1"
+    # vendor page and the prefix of its image sources, e.g. replaced by a local server for benchmarks
+    URL = 'https://consumer.huawei.com/ch/support/huaweishare/specs/'
+    IMAGE_URL_PREFIX = 'https://consumer.huawei.com/'
+    # > 0 finds the phone edge on the image downscaled this many times (cv.pyrDown) and refines it at full resolution
+    EDGE_PYRAMID_LEVELS = 0
+
     @staticmethod
-    def _load_all_new_phone_images(url, path, db_path, db_file_name):
+    def _load_all_new_phone_images(url, path, db_path, db_file_name, catalog=None):
         if not os.path.isdir(path):
             os.makedirs(path)
 
-        website = requests.get(url)
-        results = bs(website.content, 'html.parser')
-        dropdown = results.find('div', class_='nfc')
-        phones = dropdown.select('option')
-        phones.pop(0)  # delete empty image
-        for phone in phones:
-            phone_src = phone.get('value')
-            model_series_name = phone.text.strip()
+        if catalog is None:
+            phones = CatalogParser.huawei_phones(requests.get(url).content)
+        else:
+            # nothing to parse if the page was not modified
+            content = catalog.fetch(url)
+            phones = CatalogParser.huawei_phones(content) if content is not None else []
+        downloads = []
+        for model_series_name, phone_src, _ in phones:
             if '/' in model_series_name:
                 split_name = model_series_name.split('/')
                 model_series_name1 = split_name[0].strip()
                 version_name = model_series_name1.split(' ')
                 model_series_name2 = model_series_name1.replace(version_name[-1], split_name[1].lstrip())
-                if not base.check_if_data_base_entry_exists(db_path, db_file_name, model_series_name1):
-                    base.download_image(path, phone_src, model_series_name1, "https://consumer.huawei.com/")
-                else:
-                    print("Existing database entry found for: " + model_series_name1)
-                if not base.check_if_data_base_entry_exists(db_path, db_file_name, model_series_name2):
-                    base.download_image(path, phone_src, model_series_name2, "https://consumer.huawei.com/")
-                else:
-                    print("Existing database entry found for: " + model_series_name2)
+                model_series_names = [model_series_name1, model_series_name2]
             else:
-                if not base.check_if_data_base_entry_exists(db_path, db_file_name, model_series_name):
-                    base.download_image(path, phone_src, model_series_name, "https://consumer.huawei.com/")
+                model_series_names = [model_series_name]
+            for model_series_name in model_series_names:
+                if catalog is not None:
+                    catalog.add(model_series_name, phone_src)
+                if base.needs_analysis(db_path, db_file_name, model_series_name, catalog):
+                    downloads.append((path, phone_src, model_series_name, FindNfcChipForHuawei.IMAGE_URL_PREFIX))
                 else:
                     print("Existing database entry found for: " + model_series_name)
+        return downloads
 
     @staticmethod
-    def _find_phone_edge_in_image(img, filename):
+    def _find_phone_edge_in_image(img, filename, levels=None):
+        levels = levels if levels is not None else FindNfcChipForHuawei.EDGE_PYRAMID_LEVELS
+        if levels > 0:
+            return base.find_phone_edge_coarse_to_fine(
+                img, lambda img_small: FindNfcChipForHuawei._find_phone_edge_at_resolution(img_small, filename),
+                FindNfcChipForHuawei._edge_map, levels)
+        return FindNfcChipForHuawei._find_phone_edge_at_resolution(img, filename)
+
+    @staticmethod
+    def _edge_map(img):
         # Preprocessing
         # convert image to grayscale
         img_gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
         # blur
         img_blur = cv.GaussianBlur(img_gray, (1, 1), cv.BORDER_DEFAULT)
         # edge detection
-        img_canny = cv.Canny(img_blur, 0, 155)
-        for i in range(3, 10, 1):
-            # merge edges
-            img_dil = cv.dilate(img_canny, (3, 3), iterations=i)
-            img_ero = cv.erode(img_dil, (3, 3), iterations=i)
+        return cv.Canny(img_blur, 0, 155)
+
+    @staticmethod
+    def _find_phone_edge_at_resolution(img, filename):
+        img_canny = FindNfcChipForHuawei._edge_map(img)
+        # merge edges, each level continues the dilation of the previous one
+        for i, img_ero in base.merge_edges(img_canny, (3, 3), range(3, 10, 1)):
             # contour detection
             contours, hierarchies = cv.findContours(img_ero, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-            contours = sorted(contours, key=cv.contourArea, reverse=True)
+            # only the two biggest contours are compared
+            contours = heapq.nlargest(2, contours, key=cv.contourArea)
             # bad image quality -> outer edges might be artifacts -> take innerEdge if it is similar
             if len(contours) >= 2:
                 outer_contour = contours[0]
@@ -123,34 +146,64 @@ class FindNfcChipForHuawei:
     def _get_model_names_of_device_list(google_device_list, filename):
         full_name = filename.split(".")[0]
         if "HUAWEI" not in full_name:
-            return google_device_list.loc[
-                (google_device_list['Retail Branding'].str.lower() == "Huawei".lower()) &
-                (google_device_list['Marketing Name'].str.lower() == full_name.lower())]['Model'].values.tolist()
+            return google_device_list.get_models("Huawei", full_name)
         else:
             brand_name, rest = full_name.split(" ", 1)
             marketing_name = rest.split("-")[0]
-            return google_device_list.loc[
-                (google_device_list['Retail Branding'].str.lower() == brand_name.lower()) &
-                (pd.Series(google_device_list['Marketing Name'].str.lower()).str.contains(marketing_name.lower()))][
-                'Model'].values.tolist()
+            return google_device_list.get_models_containing(brand_name, marketing_name)
 
     @staticmethod
-    def main():
-        FindNfcChipForHuawei._load_all_new_phone_images('https://consumer.huawei.com/ch/support/huaweishare/specs/', 'huawei/phones/', 'nfcChipsOutput/', 'nfc_positions.json')
-        images, filenames = base.load_all_images_of_folder('huawei/phones/')
-        google_device_list = base.load_google_play_device_list()
-        nfc_chip_locations = []
-        for img, filename in zip(images, filenames):
-            x0_nfc, y0_nfc, x1_nfc, y1_nfc = FindNfcChipForHuawei._find_nfc_chip_via_color(img, filename)
-            x0_edge, y0_edge, x1_edge, y1_edge = FindNfcChipForHuawei._find_phone_edge_in_image(img, filename)
-            if x0_edge != -1 & x0_nfc != -1:
-                x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
-                                                                      x1_edge, y1_edge)
-                nfc_chip_locations.append( base.format_coordinates("Huawei", filename,
-                                                                   FindNfcChipForHuawei._get_model_names_of_device_list(
-                                                                       google_device_list, filename), x0, y0, x1, y1))
-            else:
-                print("Missing or wrong parameter to find the right coordinates for: " + filename)
+    def _analyze_image(folder, filename, edge_pyramid_levels=None):
+        img = base.load_image(os.path.join(folder, filename))
+        if img is None:
+            return None
+        with PipelineMetrics.span("chip_detection"):
+            nfc_box = FindNfcChipForHuawei._find_nfc_chip_via_color(img, filename)
+        with PipelineMetrics.span("edge_detection"):
+            edge_box = FindNfcChipForHuawei._find_phone_edge_in_image(img, filename, edge_pyramid_levels)
+        return nfc_box, edge_box
+
+    @staticmethod
+    def _to_entry(google_device_list, filename, result):
+        (x0_nfc, y0_nfc, x1_nfc, y1_nfc), (x0_edge, y0_edge, x1_edge, y1_edge) = result
+        if x0_edge != -1 & x0_nfc != -1:
+            x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
+                                                                  x1_edge, y1_edge)
+            return base.format_coordinates("Huawei", filename, FindNfcChipForHuawei._get_model_names_of_device_list(
+                                           google_device_list, filename), x0, y0, x1, y1)
+        print("Missing or wrong parameter to find the right coordinates for: " + filename)
+        return None
 
-        base.write_to_json_file(nfc_chip_locations, 'nfcChipsOutput/', 'nfc_positions.json')
-        base.delete_all_files_in_folder('huawei/phones/')
+    @staticmethod
+    def scrape(db_path, db_file_name, catalog=None):
+        # the downloads of the phones to analyze and the extra arguments of their analysis per file name (None)
+        with PipelineMetrics.span("scrape"):
+            downloads = FindNfcChipForHuawei._load_all_new_phone_images(FindNfcChipForHuawei.URL, 'huawei/phones/',
+                                                                        db_path, db_file_name, catalog)
+        return downloads, None
+
+    @staticmethod
+    def main(workers=1, db_path='nfcChipsOutput/', db_file_name='nfc_positions.json', analysis_cache_dir=None,
+             device_list_cache_dir=None, dry_run=False, edge_pyramid_levels=None, force=False,
+             catalog_cache_dir=None, compact=False):
+        if edge_pyramid_levels is None:
+            edge_pyramid_levels = FindNfcChipForHuawei.EDGE_PYRAMID_LEVELS
+        catalog = VendorCatalog("Huawei", db_path, db_file_name, catalog_cache_dir, force)
+        downloads, _ = FindNfcChipForHuawei.scrape(db_path, db_file_name, catalog)
+        if catalog.unchanged():
+            print("Huawei: the phones on the vendor page did not change since the last run, skipped")
+            return
+        catalog.print_diff()
+        google_device_list = base.load_google_play_device_list(device_list_cache_dir)
+        # every image is analyzed and written as soon as it is downloaded
+        pipeline = NfcPipeline(AnalysisCache("Huawei", base.detector_fingerprint(
+            FindNfcChipForHuawei.DETECTOR_VERSION, edge_pyramid_levels), analysis_cache_dir),
+                               'huawei/phones/', db_path, db_file_name, dry_run=dry_run, compact=compact)
+        # the level is passed with every image, worker processes do not share the state of this one
+        pipeline.run(downloads, functools.partial(FindNfcChipForHuawei._analyze_image,
+                                                  edge_pyramid_levels=edge_pyramid_levels),
+                     lambda filename, result: FindNfcChipForHuawei._to_entry(google_device_list, filename, result),
+                     workers=workers)
+        if not dry_run:
+            # the next run compares the vendor page with this one and analyzes the failed phones again
+            catalog.save(pipeline.failed(downloads), pipeline.not_located(downloads))
@@ -19,66 +19,99 @@
 """
 
 
+import math
+import sys
 import numpy as np
 import cv2 as cv
 import requests
 import os
+import functools
 from baselineFunctions import BaselineFunctions as base
-from bs4 import BeautifulSoup as bs
+from analysisCache import AnalysisCache
+from nfcPipeline import NfcPipeline
+from pipelineMetrics import PipelineMetrics
+from catalogParser import CatalogParser
+from vendorCatalog import VendorCatalog
 
 
 class FindNfcChipForSamsung:
+    # bump when the results of the detection change, cached analysis results are dropped then
+    DETECTOR_VERSION = "1"
+    # vendor page and the prefix of its image sources, e.g. replaced by a local server for benchmarks
+    URL = 'https://www.samsung.com/hk_en/nfc-support/'
+    IMAGE_URL_PREFIX = 'https:'
+    # > 0 finds the phone edge on the image downscaled this many times (cv.pyrDown) and refines it at full resolution
+    EDGE_PYRAMID_LEVELS = 0
+
     @staticmethod
-    def _load_all_new_phone_images(url, image_path, db_path, db_file_name):
+    def _load_all_new_phone_images(url, image_path, db_path, db_file_name, catalog=None):
         if not os.path.isdir(image_path):
             os.makedirs(image_path)
 
-        website = requests.get(url)
-        results = bs(website.content, 'html.parser')
-        phones = results.findAll('div', class_='phone-item')
+        if catalog is None:
+            phones = CatalogParser.samsung_phones(requests.get(url).content)
+        else:
+            # nothing to parse if the page was not modified
+            content = catalog.fetch(url)
+            phones = CatalogParser.samsung_phones(content) if content is not None else []
 
-        for phone in phones:
-            model_name = str(phone.find('div', class_='sm-text').text).strip()
+        downloads = []
+        for model_name, phone_src, _ in phones:
             if "*" in model_name:
                 model_name = model_name.replace("*", "")
-            phone_class = phone.find('img', class_='product')
-            phone_src = str(phone_class["src"])
-            if not base.check_if_data_base_entry_exists(db_path, db_file_name, model_name):
-                base.download_image(image_path, phone_src, model_name, "https:")
+            if catalog is not None:
+                catalog.add(model_name, phone_src)
+            if base.needs_analysis(db_path, db_file_name, model_name, catalog):
+                downloads.append((image_path, phone_src, model_name, FindNfcChipForSamsung.IMAGE_URL_PREFIX))
             else:
                 print("Existing database entry found for: " + model_name)
+        return downloads
+
+    @staticmethod
+    def _find_phone_edge_in_image(img, filename, levels=None):
+        levels = levels if levels is not None else FindNfcChipForSamsung.EDGE_PYRAMID_LEVELS
+        if levels > 0:
+            return base.find_phone_edge_coarse_to_fine(
+                img, lambda img_small: FindNfcChipForSamsung._find_phone_edge_at_resolution(img_small, filename),
+                FindNfcChipForSamsung._edge_map, levels)
+        return FindNfcChipForSamsung._find_phone_edge_at_resolution(img, filename)
 
     @staticmethod
-    def _find_phone_edge_in_image(img, filename):
+    def _edge_map(img):
         # Preprocessing
         # convert image to grayscale
         img_gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
         # blur
         img_blur = cv.GaussianBlur(img_gray, (3, 3), cv.BORDER_DEFAULT)
         # edge detection
-        img_canny = cv.Canny(img_blur, 0, 5)
-        # try to find clear edges
-        for i in range(10, 51, 10):
-            x0, y0, x1, y1 = FindNfcChipForSamsung._find_edge(img_canny, iterations=i)
+        return cv.Canny(img_blur, 0, 5)
+
+    @staticmethod
+    def _find_phone_edge_at_resolution(img, filename):
+        img_canny = FindNfcChipForSamsung._edge_map(img)
+        # try to find clear edges, merging the border with more iterations each time
+        for i, img_ero in base.merge_edges(img_canny, (15, 15), range(10, 51, 10)):
+            x0, y0, x1, y1 = FindNfcChipForSamsung._find_edge(img_ero)
             if x0 != -1:
                 return x0, y0, x1, y1
         print("Could not find edge in " + filename)
         return -1, -1, -1, -1
 
     @staticmethod
-    def _find_edge(img_canny, iterations):
+    def _find_edge(img_ero):
         # pixel
-        dim = img_canny.shape
+        dim = img_ero.shape
         pixel_image = dim[0] * dim[1]
-        # merge border
-        img_dil = cv.dilate(img_canny, (15, 15), iterations=iterations)
-        img_ero = cv.erode(img_dil, (15, 15), iterations=iterations)
         # contour detection
         contours, hierarchies = cv.findContours(img_ero, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
 
         if contours is not None:
             contours = sorted(contours, key=cv.contourArea, reverse=True)
             for contour in contours:
+                # the approximated polygon lies within the bounding box of the contour
+                x0, y0, w, h = cv.boundingRect(contour)
+                if (w * h / pixel_image) <= 2 / 3:
+                    continue
                 peri = cv.arcLength(contour, True)
                 approx = cv.approxPolyDP(contour, 0.02 * peri, True)
                 x0, y0, w, h = cv.boundingRect(approx)
@@ -95,17 +128,22 @@ class FindNfcChipForSamsung:
         # pixel
         dim = img.shape
         pixel_image = dim[0] * dim[1]
-        for sat in range(50, 11, -1):  # samsung has no fixed color values
+        start_sat = FindNfcChipForSamsung._find_start_saturation(hsv)
+        admitted = FindNfcChipForSamsung._count_admitted_pixels(hsv)
+        checked_masks = set()
+        for sat in range(start_sat, 11, -1):  # samsung has no fixed color values
             for hue in range(98, 102):
+                # identical masks give identical contours -> every distinct mask is only checked once
+                mask_key = FindNfcChipForSamsung._get_mask_key(admitted, sat, hue)
+                if mask_key is None or mask_key in checked_masks:
+                    continue
+                checked_masks.add(mask_key)
                 lower_range = np.array([80, sat, 20])
                 upper_range = np.array([hue, 255, 255])
                 mask = cv.inRange(hsv, lower_range, upper_range)
                 contours, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_SIMPLE)
-                big_contours = []
-                for contour in contours:
-                    area = cv.contourArea(contour)
-                    if area > 500:
-                        big_contours.append(contour)
+                areas = FindNfcChipForSamsung._contour_areas(contours)
+                big_contours = [contour for contour, area in zip(contours, areas) if area > 500]
                 if len(big_contours) != 0:
                     x0, y0, x1, y1 = FindNfcChipForSamsung._check_contours(big_contours, pixel_image)
                     if x0 != -1:
@@ -113,48 +151,166 @@ class FindNfcChipForSamsung:
         print("No nfc-chip found for " + filename)
         return -1, -1, -1, -1
 
+    @staticmethod
+    def _find_start_saturation(hsv):
+        # a contour with an area > 500 needs a connected region whose bounding box is bigger than 500 pixel.
+        # The masks only grow with lower saturation, so the highest saturation which has such a region with the
+        # widest hue range is found by binary search, every saturation above it cannot find a contour.
+        # Returns 11 (-> no iteration) if no saturation has one.
+        def has_big_region(sat):
+            mask = cv.inRange(hsv, np.array([80, sat, 20]), np.array([101, 255, 255]))
+            count, labels, stats, centroids = cv.connectedComponentsWithStats(mask, connectivity=8)
+            widths, heights = stats[1:, cv.CC_STAT_WIDTH], stats[1:, cv.CC_STAT_HEIGHT]
+            return bool(np.any((widths - 1) * (heights - 1) > 500))
+
+        low, high = 12, 50
+        if not has_big_region(low):
+            return 11
+        while low < high:
+            middle = (low + high + 1) // 2
+            if has_big_region(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    @staticmethod
+    def _contour_areas(contours):
+        # same as cv.contourArea for every contour (shoelace formula, exact for integer points)
+        if len(contours) == 0:
+            return np.zeros(0)
+        points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+        lengths = np.array([len(contour) for contour in contours])
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # previous point of every point, the first point of a contour is preceded by its last one
+        previous = np.roll(points, 1, axis=0)
+        previous[starts] = points[starts + lengths - 1]
+        cross = previous[:, 0] * points[:, 1] - previous[:, 1] * points[:, 0]
+        return np.abs(np.add.reduceat(cross, starts) * 0.5)
+
+    @staticmethod
+    def _count_admitted_pixels(hsv):
+        # admitted[s, h] = number of pixels with saturation s and hue h which pass the fixed bounds of all masks
+        hue, sat, val = cv.split(hsv)
+        candidates = (hue >= 80) & (hue <= 101) & (sat >= 12) & (val >= 20)
+        index = sat[candidates].astype(np.int64) * 256 + hue[candidates]
+        return np.bincount(index, minlength=256 * 256).reshape(256, 256)
+
+    @staticmethod
+    def _get_mask_key(admitted, sat, hue):
+        # a mask is fully described by the lowest saturation and the highest hue of the pixels it contains,
+        # None for an empty mask
+        counts = admitted[sat:, 80:hue + 1]
+        rows = np.flatnonzero(counts.any(axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(counts.any(axis=0))
+        return sat + rows[0], 80 + cols[-1]
+
     @staticmethod
     def _check_contours(contours, pixel_image):
+        match_values = FindNfcChipForSamsung._match_shapes(contours)
         min_match_val = 0.1
-        for contour in contours:
-            for contour_to_check in contours:
-                matching_value = cv.matchShapes(contour_to_check, contour, 1, 0.0)
-                if (matching_value < min_match_val) & (matching_value != 0.0):
-                    min_match_val = matching_value
-                    peri = cv.arcLength(contour, True)
-                    approx = cv.approxPolyDP(contour, 0.02 * peri, True)
-                    x0, y0, w, h = cv.boundingRect(approx)
-                    pixel_contour = w * h
-                    if (pixel_contour / pixel_image) < 0.5:  # assumption: nfc chip size is not 50% of the image
-                        return x0, y0, (x0 + w), (y0 + h)
+        for i, contour in enumerate(contours):
+            matching_values = match_values[:, i]
+            better_values = matching_values[(matching_values < min_match_val) & (matching_values != 0.0)]
+            if len(better_values) != 0:
+                # every better match in this row checks the same contour -> only the first one can succeed
+                peri = cv.arcLength(contour, True)
+                approx = cv.approxPolyDP(contour, 0.02 * peri, True)
+                x0, y0, w, h = cv.boundingRect(approx)
+                pixel_contour = w * h
+                if (pixel_contour / pixel_image) < 0.5:  # assumption: nfc chip size is not 50% of the image
+                    return x0, y0, (x0 + w), (y0 + h)
+                min_match_val = better_values.min()
         return -1, -1, -1, -1
 
+    @staticmethod
+    def _match_shapes(contours):
+        # match_values[j, i] == cv.matchShapes(contours[j], contours[i], 1, 0.0), but the hu moments of every
+        # contour are computed once instead of for every pair
+        eps = 1.e-5
+        count = len(contours)
+        inverse_logs = np.zeros((count, 7))
+        valid = np.zeros((count, 7), dtype=bool)
+        has_moments = np.zeros(count, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k, contour in enumerate(contours):
+                hu_moments = cv.HuMoments(cv.moments(contour)).flatten()
+                has_moments[k] = np.any(hu_moments != 0)
+                for i, hu_moment in enumerate(hu_moments):
+                    amplitude = abs(float(hu_moment))
+                    if amplitude > eps:
+                        sign = 1 if hu_moment > 0 else -1
+                        inverse_logs[k, i] = np.float64(1.) / (sign * math.log10(amplitude))
+                        valid[k, i] = True
+            match_values = np.zeros((count, count))
+            # same summation order as cv.matchShapes
+            for i in range(7):
+                both_valid = valid[:, None, i] & valid[None, :, i]
+                differences = np.abs(-inverse_logs[:, None, i] + inverse_logs[None, :, i])
+                match_values = match_values + np.where(both_valid, differences, 0.0)
+        match_values[has_moments[:, None] != has_moments[None, :]] = sys.float_info.max
+        return match_values
+
     @staticmethod
     def _get_model_names_of_device_list(google_device_list, file_name):
         full_name = file_name.split(".")[0]
         brand_name, marketing_name = full_name.split(" ", 1)
-        return google_device_list.loc[
-            (google_device_list['Retail Branding'] == brand_name) &
-            (google_device_list['Marketing Name'] == marketing_name)]['Model'].values.tolist()
-
-    @staticmethod
-    def main():
-        FindNfcChipForSamsung._load_all_new_phone_images('https://www.samsung.com/hk_en/nfc-support/',
-                                                         'samsung/phones/', 'nfcChipsOutput/', 'nfc_positions.json')
-        images, file_names = base.load_all_images_of_folder('samsung/phones/')
-        google_device_list = base.load_google_play_device_list()
-        nfc_chip_locations = []
-        for img, file_name in zip(images, file_names):
-            x0_nfc, y0_nfc, x1_nfc, y1_nfc = FindNfcChipForSamsung._find_nfc_chip_via_color(img, file_name)
-            x0_edge, y0_edge, x1_edge, y1_edge = FindNfcChipForSamsung._find_phone_edge_in_image(img, file_name)
-            if x0_edge != -1 & x0_nfc != -1:
-                x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
-                                                                      x1_edge, y1_edge)
-                nfc_chip_locations.append(
-                    base.format_coordinates("Samsung", file_name, FindNfcChipForSamsung._get_model_names_of_device_list(
-                                            google_device_list, file_name), x0, y0, x1, y1))
-            else:
-                print("Missing or wrong parameter to find the right coordinates for: " + file_name)
+        return google_device_list.get_models(brand_name, marketing_name)
 
-        base.write_to_json_file(nfc_chip_locations, 'nfcChipsOutput/', 'nfc_positions.json')
-        base.delete_all_files_in_folder('samsung/phones/')
+    @staticmethod
+    def _analyze_image(folder, file_name, edge_pyramid_levels=None):
+        img = base.load_image(os.path.join(folder, file_name))
+        if img is None:
+            return None
+        with PipelineMetrics.span("chip_detection"):
+            nfc_box = FindNfcChipForSamsung._find_nfc_chip_via_color(img, file_name)
+        with PipelineMetrics.span("edge_detection"):
+            edge_box = FindNfcChipForSamsung._find_phone_edge_in_image(img, file_name, edge_pyramid_levels)
+        return nfc_box, edge_box
+
+    @staticmethod
+    def _to_entry(google_device_list, file_name, result):
+        (x0_nfc, y0_nfc, x1_nfc, y1_nfc), (x0_edge, y0_edge, x1_edge, y1_edge) = result
+        if x0_edge != -1 & x0_nfc != -1:
+            x0, y0, x1, y1 = base.nfc_chip_coordinates_in_percent(x0_nfc, y0_nfc, x1_nfc, y1_nfc, x0_edge, y0_edge,
+                                                                  x1_edge, y1_edge)
+            return base.format_coordinates("Samsung", file_name, FindNfcChipForSamsung._get_model_names_of_device_list(
+                                           google_device_list, file_name), x0, y0, x1, y1)
+        print("Missing or wrong parameter to find the right coordinates for: " + file_name)
+        return None
+
+    @staticmethod
+    def scrape(db_path, db_file_name, catalog=None):
+        # the downloads of the phones to analyze and the extra arguments of their analysis per file name (None)
+        with PipelineMetrics.span("scrape"):
+            downloads = FindNfcChipForSamsung._load_all_new_phone_images(FindNfcChipForSamsung.URL, 'samsung/phones/',
+                                                                         db_path, db_file_name, catalog)
+        return downloads, None
+
+    @staticmethod
+    def main(workers=1, db_path='nfcChipsOutput/', db_file_name='nfc_positions.json', analysis_cache_dir=None,
+             device_list_cache_dir=None, dry_run=False, edge_pyramid_levels=None, force=False,
+             catalog_cache_dir=None, compact=False):
+        if edge_pyramid_levels is None:
+            edge_pyramid_levels = FindNfcChipForSamsung.EDGE_PYRAMID_LEVELS
+        catalog = VendorCatalog("Samsung", db_path, db_file_name, catalog_cache_dir, force)
+        downloads, _ = FindNfcChipForSamsung.scrape(db_path, db_file_name, catalog)
+        if catalog.unchanged():
+            print("Samsung: the phones on the vendor page did not change since the last run, skipped")
+            return
+        catalog.print_diff()
+        google_device_list = base.load_google_play_device_list(device_list_cache_dir)
+        # every image is analyzed and written as soon as it is downloaded
+        pipeline = NfcPipeline(AnalysisCache("Samsung", base.detector_fingerprint(
+            FindNfcChipForSamsung.DETECTOR_VERSION, edge_pyramid_levels), analysis_cache_dir),
+                               'samsung/phones/', db_path, db_file_name, dry_run=dry_run, compact=compact)
+        # the level is passed with every image, worker processes do not share the state of this one
+        pipeline.run(downloads, functools.partial(FindNfcChipForSamsung._analyze_image,
+                                                  edge_pyramid_levels=edge_pyramid_levels),
+                     lambda file_name, result: FindNfcChipForSamsung._to_entry(google_device_list, file_name, result),
+                     workers=workers)
+        if not dry_run:
+            # the next run compares the vendor page with this one and analyzes the failed phones again
+            catalog.save(pipeline.failed(downloads), pipeline.not_located(downloads))
@@ -0,0 +1,187 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import pickle
+import threading
+import requests
+from imageDownloader import ImageDownloader
+from nfcDatabase import AtomicFile, LockFile
+from pipelineMetrics import PipelineMetrics
+
+"""
+GooglePlayDeviceList keeps a local copy of Google Play's supported_devices.csv which is revalidated with a
+conditional GET (ETag / Last-Modified). The csv is parsed once into a pickled index of
+(brand, marketing name) -> models, so later runs do not parse the csv again. Within a process the list is only
+loaded once, revalidate() checks for a new csv in long-running processes. Processes sharing the cache folder
+revalidate and build the index one after another under a lock file.
+"""
+class GooglePlayDeviceList:
+    URL = "https://storage.googleapis.com/play_public/supported_devices.csv"
+    CACHE_DIR = "cache/"
+    CSV_FILE_NAME = "supported_devices.csv"
+    META_FILE_NAME = "supported_devices.meta.json"
+    INDEX_FILE_NAME = "supported_devices.index.pickle"
+    INDEX_VERSION = 1
+    LOCK_FILE_NAME = "supported_devices.lock"
+    # the csv download can take a while, a lock older than this is taken over
+    LOCK_TIMEOUT_SECONDS = 600
+
+    _loaded = {}
+    # csv stamp of the loaded lists
+    _stamps = {}
+    _lock = threading.Lock()
+
+    def __init__(self, by_brand_and_name, by_brand):
+        # (brand, marketing name) -> models and brand -> [(marketing name, model)], all names normalized
+        self._by_brand_and_name = by_brand_and_name
+        self._by_brand = by_brand
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(str(name).split()).lower()
+
+    @staticmethod
+    def load(cache_dir=None, url=None):
+        cache_dir = cache_dir or GooglePlayDeviceList.CACHE_DIR
+        url = url or GooglePlayDeviceList.URL
+        with GooglePlayDeviceList._lock:
+            key = (os.path.abspath(cache_dir), url)
+            if key not in GooglePlayDeviceList._loaded:
+                with PipelineMetrics.span("device_list_load"):
+                    device_list, csv_stamp = GooglePlayDeviceList._load_from_cache(cache_dir, url)
+                GooglePlayDeviceList._loaded[key] = device_list
+                GooglePlayDeviceList._stamps[key] = csv_stamp
+            return GooglePlayDeviceList._loaded[key]
+
+    @staticmethod
+    def revalidate(cache_dir=None, url=None):
+        # for long-running processes: the list is only loaded again if a new csv was downloaded
+        cache_dir = cache_dir or GooglePlayDeviceList.CACHE_DIR
+        url = url or GooglePlayDeviceList.URL
+        csv_file = os.path.join(cache_dir, GooglePlayDeviceList.CSV_FILE_NAME)
+        with GooglePlayDeviceList._lock:
+            key = (os.path.abspath(cache_dir), url)
+            if key in GooglePlayDeviceList._loaded:
+                with GooglePlayDeviceList._cache_lock(cache_dir):
+                    GooglePlayDeviceList._revalidate(url, csv_file,
+                                                     os.path.join(cache_dir, GooglePlayDeviceList.META_FILE_NAME))
+                if GooglePlayDeviceList._stamp(csv_file) != GooglePlayDeviceList._stamps.get(key):
+                    del GooglePlayDeviceList._loaded[key]
+        return GooglePlayDeviceList.load(cache_dir, url)
+
+    @staticmethod
+    def _cache_lock(cache_dir):
+        return LockFile(os.path.join(cache_dir, GooglePlayDeviceList.LOCK_FILE_NAME),
+                        GooglePlayDeviceList.LOCK_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def _load_from_cache(cache_dir, url):
+        # (device list, stamp of the csv it was built from)
+        os.makedirs(cache_dir, exist_ok=True)
+        with GooglePlayDeviceList._cache_lock(cache_dir):
+            device_list = GooglePlayDeviceList._load_locked(cache_dir, url)
+            return device_list, GooglePlayDeviceList._stamp(
+                os.path.join(cache_dir, GooglePlayDeviceList.CSV_FILE_NAME))
+
+    @staticmethod
+    def _load_locked(cache_dir, url):
+        csv_file = os.path.join(cache_dir, GooglePlayDeviceList.CSV_FILE_NAME)
+        index_file = os.path.join(cache_dir, GooglePlayDeviceList.INDEX_FILE_NAME)
+        GooglePlayDeviceList._revalidate(url, csv_file, os.path.join(cache_dir, GooglePlayDeviceList.META_FILE_NAME))
+        csv_stamp = GooglePlayDeviceList._stamp(csv_file)
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, "rb") as f:
+                    index = pickle.load(f)
+                if index["version"] == GooglePlayDeviceList.INDEX_VERSION and index["csv_stamp"] == csv_stamp:
+                    return GooglePlayDeviceList(index["by_brand_and_name"], index["by_brand"])
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+                print("Error: Index " + index_file + " could not be read, rebuilding it")
+        by_brand_and_name, by_brand = GooglePlayDeviceList._build_index(csv_file)
+        with AtomicFile(index_file, "wb") as f:
+            pickle.dump({"version": GooglePlayDeviceList.INDEX_VERSION, "csv_stamp": csv_stamp,
+                         "by_brand_and_name": by_brand_and_name, "by_brand": by_brand}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        return GooglePlayDeviceList(by_brand_and_name, by_brand)
+
+    @staticmethod
+    def _stamp(path_to_file):
+        stat = os.stat(path_to_file)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _revalidate(url, csv_file, meta_file):
+        meta = {}
+        if os.path.exists(csv_file) and os.path.exists(meta_file):
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            with ImageDownloader.get_session().get(url, headers=headers, stream=True,
+                                                   timeout=ImageDownloader.TIMEOUT) as response:
+                if response.status_code == 304:
+                    return
+                response.raise_for_status()
+                with AtomicFile(csv_file, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=ImageDownloader.CHUNK_SIZE):
+                        f.write(chunk)
+                meta = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+            with AtomicFile(meta_file, "w") as f:
+                json.dump(meta, f)
+        except (requests.RequestException, OSError) as e:
+            if not os.path.exists(csv_file):
+                raise
+            print("Error: Device list could not be revalidated, using cached copy: " + repr(e))
+
+    @staticmethod
+    def _build_index(csv_file):
+        # pandas is only needed when the index is rebuilt
+        import pandas as pd
+        device_list = pd.read_csv(csv_file, encoding="utf-16")
+        by_brand_and_name = {}
+        by_brand = {}
+        for brand, marketing_name, model in zip(device_list['Retail Branding'], device_list['Marketing Name'],
+                                                device_list['Model']):
+            if not isinstance(brand, str) or not isinstance(marketing_name, str) or not isinstance(model, str):
+                continue
+            brand = GooglePlayDeviceList.normalize(brand)
+            marketing_name = GooglePlayDeviceList.normalize(marketing_name)
+            by_brand_and_name.setdefault((brand, marketing_name), []).append(model)
+            by_brand.setdefault(brand, []).append((marketing_name, model))
+        return by_brand_and_name, by_brand
+
+    def get_models(self, brand, marketing_name):
+        with PipelineMetrics.span("device_list_lookup"):
+            key = (GooglePlayDeviceList.normalize(brand), GooglePlayDeviceList.normalize(marketing_name))
+            return list(self._by_brand_and_name.get(key, []))
+
+    def get_models_containing(self, brand, marketing_name_part):
+        # only the devices of one brand are scanned
+        with PipelineMetrics.span("device_list_lookup"):
+            marketing_name_part = GooglePlayDeviceList.normalize(marketing_name_part)
+            return [model for marketing_name, model in self._by_brand.get(GooglePlayDeviceList.normalize(brand), [])
+                    if marketing_name_part in marketing_name]
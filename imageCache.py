@@ -0,0 +1,170 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from nfcDatabase import AtomicFile, LockFile
+
+"""
+ImageCache is a persistent, content addressed cache for the downloaded phone images.
+The bytes of an image are stored once under their sha256 in blobs/, and for every url a small record in urls/ keeps
+the ETag / Last-Modified of the response and the hash of its content. A later run revalidates the url with a
+conditional GET and reuses the stored bytes on 304. The cache is bounded in size and evicts the least recently used
+urls first. Vendors running at the same time share the cache: storing, reusing and evicting run under a lock file, so
+an eviction never removes a blob another process is copying.
+"""
+class ImageCache:
+    CACHE_DIR = "cache/images/"
+    MAX_BYTES = 512 * 1024 * 1024
+    LOCK_FILE_NAME = "cache.lock"
+    LOCK_TIMEOUT_SECONDS = 60
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or ImageCache.CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else ImageCache.MAX_BYTES
+        self._blob_dir = os.path.join(self.cache_dir, "blobs")
+        self._url_dir = os.path.join(self.cache_dir, "urls")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._url_dir, exist_ok=True)
+
+    @staticmethod
+    def get_default():
+        with ImageCache._default_lock:
+            if ImageCache._default is None:
+                ImageCache._default = ImageCache()
+            return ImageCache._default
+
+    @staticmethod
+    def configure(cache_dir=None, max_bytes=None):
+        with ImageCache._default_lock:
+            ImageCache._default = ImageCache(cache_dir, max_bytes)
+            return ImageCache._default
+
+    def _record_file(self, url):
+        return os.path.join(self._url_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def blob_file(self, content_hash):
+        return os.path.join(self._blob_dir, content_hash[:2], content_hash)
+
+    def get_record(self, url):
+        try:
+            with open(self._record_file(url), "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.blob_file(record["sha256"])):
+            return None
+        return record
+
+    def conditional_headers(self, url):
+        record = self.get_record(url)
+        headers = {}
+        if record is not None:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def _locked(self):
+        # across the processes and threads using this cache folder
+        return LockFile(os.path.join(self.cache_dir, ImageCache.LOCK_FILE_NAME), ImageCache.LOCK_TIMEOUT_SECONDS)
+
+    def reuse(self, url, path_to_file):
+        # after a 304: marks the url as recently used and copies its bytes to path_to_file, None if they are missing
+        with self._locked():
+            record = self.get_record(url)
+            if record is not None:
+                record["last_access"] = time.time()
+                self._write_record(url, record)
+                self.materialize(record["sha256"], path_to_file)
+        return record
+
+    def store(self, url, tmp_file, content_hash, etag=None, last_modified=None, path_to_file=None):
+        # moves the downloaded tmp_file into the cache and copies it to path_to_file if given
+        blob_file = self.blob_file(content_hash)
+        os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+        with self._locked():
+            if os.path.exists(blob_file):
+                os.remove(tmp_file)
+            else:
+                os.replace(tmp_file, blob_file)
+            record = {"url": url, "sha256": content_hash, "size": os.path.getsize(blob_file), "etag": etag,
+                      "last_modified": last_modified, "last_access": time.time()}
+            self._write_record(url, record)
+            if path_to_file is not None:
+                self.materialize(content_hash, path_to_file)
+        return record
+
+    def _write_record(self, url, record):
+        with AtomicFile(self._record_file(url), "w") as f:
+            json.dump(record, f)
+
+    def materialize(self, content_hash, path_to_file):
+        # copy the cached bytes into the working folder of a vendor, called under the lock
+        with open(self.blob_file(content_hash), "rb") as blob, AtomicFile(path_to_file, "wb") as f:
+            shutil.copyfileobj(blob, f)
+
+    def evict(self):
+        with self._locked():
+            records = []
+            for record_name in os.listdir(self._url_dir):
+                if not record_name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self._url_dir, record_name), "r") as f:
+                        records.append((record_name, json.load(f)))
+                except (OSError, ValueError):
+                    continue
+            references = {}
+            for record_name, record in records:
+                references[record["sha256"]] = references.get(record["sha256"], 0) + 1
+            total = sum(ImageCache._size_of(self.blob_file(content_hash)) for content_hash in references)
+            # least recently used first, a file removed in the meantime (e.g. by hand) is skipped
+            for record_name, record in sorted(records, key=lambda named_record: named_record[1]["last_access"]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self._url_dir, record_name))
+                except FileNotFoundError:
+                    pass
+                references[record["sha256"]] -= 1
+                blob_file = self.blob_file(record["sha256"])
+                if references[record["sha256"]] == 0:
+                    total -= ImageCache._size_of(blob_file)
+                    try:
+                        os.remove(blob_file)
+                    except FileNotFoundError:
+                        pass
+
+    @staticmethod
+    def _size_of(path_to_file):
+        try:
+            return os.path.getsize(path_to_file)
+        except FileNotFoundError:
+            return 0
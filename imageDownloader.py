@@ -0,0 +1,145 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import hashlib
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from imageCache import ImageCache
+from pipelineMetrics import PipelineMetrics
+
+"""
+ImageDownloader downloads the phone images concurrently over one pooled requests.Session.
+Every download has a timeout, is retried with exponential backoff and is streamed in chunks to a temporary
+file which is renamed when the download is complete.
+With USE_CACHE the images go through the content addressed ImageCache, so unchanged images are only revalidated.
+"""
+class ImageDownloader:
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = (5, 30)  # connect, read in seconds
+    RETRIES = 3
+    BACKOFF_SECONDS = 0.5
+    MAX_WORKERS = 8
+    MAX_PER_HOST = 4
+    USE_CACHE = True
+
+    _session = None
+    _session_lock = threading.Lock()
+
+    @staticmethod
+    def get_session():
+        with ImageDownloader._session_lock:
+            if ImageDownloader._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=ImageDownloader.MAX_WORKERS,
+                                      pool_maxsize=ImageDownloader.MAX_WORKERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                ImageDownloader._session = session
+            return ImageDownloader._session
+
+    @staticmethod
+    def download(url, path_to_file, session=None, cache=None):
+        with PipelineMetrics.span("download"):
+            success = ImageDownloader._download(url, path_to_file, session, cache)
+        PipelineMetrics.count("downloads" if success else "download_failures")
+        return success
+
+    @staticmethod
+    def _download(url, path_to_file, session, cache):
+        session = session if session is not None else ImageDownloader.get_session()
+        for attempt in range(ImageDownloader.RETRIES + 1):
+            tmp_file = None
+            try:
+                headers = cache.conditional_headers(url) if cache is not None else {}
+                with session.get(url, headers=headers, stream=True, timeout=ImageDownloader.TIMEOUT) as response:
+                    if response.status_code == 304:
+                        if cache.reuse(url, path_to_file) is not None:
+                            PipelineMetrics.count("downloads_not_modified")
+                            return True
+                        raise requests.RequestException("Not modified, but the image is missing in the cache")
+                    response.raise_for_status()
+                    content_hash = hashlib.sha256()
+                    # a unique name, another run might download the same image into the same folder
+                    fd, tmp_file = tempfile.mkstemp(prefix="." + os.path.basename(path_to_file) + ".", suffix=".part",
+                                                    dir=os.path.dirname(path_to_file) or ".")
+                    with os.fdopen(fd, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=ImageDownloader.CHUNK_SIZE):
+                            content_hash.update(chunk)
+                            f.write(chunk)
+                    if cache is not None:
+                        cache.store(url, tmp_file, content_hash.hexdigest(), response.headers.get("ETag"),
+                                    response.headers.get("Last-Modified"), path_to_file)
+                    else:
+                        os.replace(tmp_file, path_to_file)
+                return True
+            except (requests.RequestException, OSError) as e:
+                if tmp_file is not None and os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                if attempt == ImageDownloader.RETRIES or not ImageDownloader._is_retryable(e):
+                    print("Error: Download of " + url + " failed: " + repr(e))
+                    return False
+                time.sleep(ImageDownloader.BACKOFF_SECONDS * 2 ** attempt)
+        return False
+
+    @staticmethod
+    def _is_retryable(error):
+        # client errors like 404 will not change by asking again
+        response = getattr(error, "response", None)
+        if response is None:
+            return True
+        return response.status_code == 429 or response.status_code >= 500
+
+    @staticmethod
+    def download_as_completed(downloads, session=None, max_workers=None, max_per_host=None, cache=None):
+        # downloads is a list of (url, path_to_file) - yields (url, path_to_file, success) as soon as a download is
+        # done, so the images can be processed while the others are still loading
+        session = session if session is not None else ImageDownloader.get_session()
+        if cache is None and ImageDownloader.USE_CACHE:
+            cache = ImageCache.get_default()
+        max_workers = max_workers or ImageDownloader.MAX_WORKERS
+        max_per_host = max_per_host or ImageDownloader.MAX_PER_HOST
+        host_limits = {}
+        for url, path_to_file in downloads:
+            host = urlsplit(url).netloc
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(max_per_host)
+
+        def download_limited(url, path_to_file):
+            with host_limits[urlsplit(url).netloc]:
+                print("Downloading: " + url)
+                return ImageDownloader.download(url, path_to_file, session, cache)
+
+        if len(downloads) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(downloads))) as executor:
+            futures = {executor.submit(download_limited, url, path_to_file): (url, path_to_file)
+                       for url, path_to_file in downloads}
+            for future in as_completed(futures):
+                url, path_to_file = futures[future]
+                yield url, path_to_file, future.result()
+        if cache is not None:
+            cache.evict()
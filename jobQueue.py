@@ -0,0 +1,160 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import time
+import sqlite3
+
+"""
+JobQueue holds the analysis tasks of a distributed run, one task per phone image: vendor, file name, image url and the
+extra arguments of the analysis. A worker claims a task with a lease of LEASE_SECONDS, a task whose lease ran out (e.g.
+the worker crashed) is claimed again by the next worker, after MAX_ATTEMPTS it is failed. Finished tasks keep their
+result until they are merged into the database.
+JobQueue.open(location) picks the backend by the scheme of the location, "sqlite://path" or just a path. Another
+backend (e.g. a shared database server) only has to provide the methods of SqliteJobQueue and register its scheme.
+"""
+class JobQueue:
+    LEASE_SECONDS = 600
+    MAX_ATTEMPTS = 3
+    # scheme -> backend class, see the end of this file
+    BACKENDS = {}
+
+    @staticmethod
+    def open(location):
+        scheme, separator, path = location.partition("://")
+        if not separator:
+            scheme, path = "sqlite", location
+        if scheme not in JobQueue.BACKENDS:
+            raise ValueError("Unknown job queue backend: " + scheme)
+        return JobQueue.BACKENDS[scheme](path)
+
+
+class SqliteJobQueue:
+    # one SQLite file for all hosts - on one machine or on a share with working file locks (e.g. SMB, NFS with lockd).
+    # WAL would need shared memory between the hosts, which network file systems do not provide, so the rollback
+    # journal is used
+    JOURNAL_MODE = "DELETE"
+
+    def __init__(self, path_to_file, lease_seconds=None, max_attempts=None):
+        self.path_to_file = path_to_file
+        self.lease_seconds = lease_seconds or JobQueue.LEASE_SECONDS
+        self.max_attempts = max_attempts or JobQueue.MAX_ATTEMPTS
+        os.makedirs(os.path.dirname(path_to_file) or ".", exist_ok=True)
+        # transactions are started explicitly, BEGIN IMMEDIATE makes a claim atomic across processes
+        self.connection = sqlite3.connect(path_to_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = " + SqliteJobQueue.JOURNAL_MODE)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, vendor TEXT NOT NULL, "
+                                "file_name TEXT NOT NULL, url TEXT NOT NULL, args TEXT NOT NULL, "
+                                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                                "owner TEXT, lease_expires REAL, result TEXT, error TEXT, "
+                                "merged INTEGER NOT NULL DEFAULT 0, UNIQUE (vendor, file_name))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires)")
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, tasks):
+        # tasks are dicts with vendor, file_name, url and args - a known task is only queued again if its url or args
+        # changed or it failed, returns the number of queued tasks
+        queued = 0
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for task in tasks:
+                args = json.dumps(list(task["args"]))
+                cursor = self.connection.execute(
+                    "INSERT INTO tasks (vendor, file_name, url, args) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (vendor, file_name) DO UPDATE SET url = excluded.url, args = excluded.args, "
+                    "status = 'pending', attempts = 0, owner = NULL, lease_expires = NULL, result = NULL, "
+                    "error = NULL, merged = 0 "
+                    "WHERE url != excluded.url OR args != excluded.args OR status = 'failed'",
+                    (task["vendor"], task["file_name"], task["url"], args))
+                queued += cursor.rowcount
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return queued
+
+    def claim(self, owner):
+        # the next pending task or one with an expired lease, None if there is none right now
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # expired leases without attempts left are failed
+            self.connection.execute("UPDATE tasks SET status = 'failed', owner = NULL, error = 'lease expired' "
+                                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                                    (now, self.max_attempts))
+            row = self.connection.execute("SELECT id, vendor, file_name, url, args, attempts FROM tasks "
+                                          "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                                          "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?, "
+                                        "attempts = attempts + 1 WHERE id = ?",
+                                        (owner, now + self.lease_seconds, row[0]))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        task_id, vendor, file_name, url, args, attempts = row
+        return {"id": task_id, "vendor": vendor, "file_name": file_name, "url": url, "args": json.loads(args),
+                "attempt": attempts + 1}
+
+    def complete(self, task_id, owner, result):
+        # False if the lease was lost in the meantime, the result of the new owner counts then
+        cursor = self.connection.execute("UPDATE tasks SET status = 'done', result = ?, lease_expires = NULL "
+                                         "WHERE id = ? AND owner = ? AND status = 'leased'",
+                                         (json.dumps(result), task_id, owner))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, owner, error):
+        # the task is tried again by the next claim until it has no attempts left
+        self.connection.execute("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                                "owner = NULL, lease_expires = NULL, error = ? "
+                                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                                (self.max_attempts, str(error), task_id, owner))
+
+    def retry_failed(self, vendor):
+        # the failed tasks of the vendor are pending again with all attempts, returns their number
+        cursor = self.connection.execute("UPDATE tasks SET status = 'pending', attempts = 0, owner = NULL, "
+                                         "lease_expires = NULL, error = NULL WHERE vendor = ? AND status = 'failed'",
+                                         (vendor,))
+        return cursor.rowcount
+
+    def unmerged(self):
+        rows = self.connection.execute("SELECT id, vendor, file_name, result FROM tasks "
+                                       "WHERE status = 'done' AND merged = 0 ORDER BY id").fetchall()
+        return [{"id": task_id, "vendor": vendor, "file_name": file_name, "result": json.loads(result)}
+                for task_id, vendor, file_name, result in rows]
+
+    def mark_merged(self, task_ids):
+        self.connection.executemany("UPDATE tasks SET merged = 1 WHERE id = ?", [(task_id,) for task_id in task_ids])
+
+    def counts(self):
+        # number of tasks per status, leases that ran out count as pending
+        rows = self.connection.execute("SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' "
+                                       "ELSE status END, count(*) FROM tasks GROUP BY 1", (time.time(),)).fetchall()
+        return dict(rows)
+
+
+JobQueue.BACKENDS["sqlite"] = SqliteJobQueue
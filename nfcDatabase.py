@@ -0,0 +1,245 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import tempfile
+import threading
+import time
+from pipelineMetrics import PipelineMetrics
+
+"""
+NfcDatabase holds the entries of nfc_positions.json in memory. The file is read once and the entries are indexed
+by marketingName, manufacturer and every model name, so lookups do not touch the file again.
+Use NfcDatabase.get(path, db_file_name) to share one instance between the scrapers and the runner.
+Entries are unique per manufacturer and marketingName. upsert() only records changed entries and save() merges them
+into the file under a lock file and replaces it atomically, so several runs can commit small batches safely.
+"""
+class NfcDatabase:
+    LOCK_TIMEOUT_SECONDS = 60
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path_to_file):
+        self.path_to_file = path_to_file
+        self._lock = threading.RLock()
+        self.entries = []
+        self._by_key = {}
+        self._by_marketing_name = {}
+        self._by_manufacturer = {}
+        self._by_model_name = {}
+        self._pending = {}
+        self._loaded_stat = None
+        self.load()
+
+    @staticmethod
+    def get(path, db_file_name):
+        path_to_file = os.path.abspath(path + str(db_file_name))
+        with NfcDatabase._instances_lock:
+            database = NfcDatabase._instances.get(path_to_file)
+            if database is None:
+                database = NfcDatabase(path_to_file)
+                NfcDatabase._instances[path_to_file] = database
+            return database
+
+    @staticmethod
+    def key_of(entry):
+        return entry["manufacturer"], entry["marketingName"]
+
+    def load(self):
+        with self._lock:
+            self.entries = []
+            self._by_key = {}
+            self._by_marketing_name = {}
+            self._by_manufacturer = {}
+            self._by_model_name = {}
+            self._pending = {}
+            self._loaded_stat = self._file_stat()
+            if self._loaded_stat is None:
+                return
+            try:
+                with open(self.path_to_file, 'r', encoding='utf-8') as f:
+                    data_entries = json.load(f)
+            except (OSError, ValueError):
+                print("Error: DataBaseFile " + str(self.path_to_file) + " could not be opened")
+                return
+            for data_entry in data_entries:
+                self._upsert(data_entry)
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path_to_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _upsert(self, entry):
+        key = NfcDatabase.key_of(entry)
+        existing = self._by_key.get(key)
+        if existing is not None:
+            if existing == entry:
+                return False
+            self._unindex(existing)
+            self.entries[self.entries.index(existing)] = entry
+        else:
+            self.entries.append(entry)
+        self._by_key[key] = entry
+        self._by_marketing_name.setdefault(entry["marketingName"], []).append(entry)
+        self._by_manufacturer.setdefault(entry["manufacturer"], []).append(entry)
+        for model_name in entry["modelNames"]:
+            self._by_model_name.setdefault(model_name, []).append(entry)
+        return True
+
+    def _unindex(self, entry):
+        indexes = [(self._by_marketing_name, entry["marketingName"]), (self._by_manufacturer, entry["manufacturer"])]
+        indexes += [(self._by_model_name, model_name) for model_name in entry["modelNames"]]
+        for index, value in indexes:
+            bucket = [indexed for indexed in index.get(value, []) if indexed is not entry]
+            if len(bucket) > 0:
+                index[value] = bucket
+            else:
+                index.pop(value, None)
+
+    def contains_marketing_name(self, marketing_name):
+        with self._lock:
+            return str(marketing_name) in self._by_marketing_name
+
+    def get_entry(self, manufacturer, marketing_name):
+        with self._lock:
+            return self._by_key.get((manufacturer, str(marketing_name)))
+
+    def get_by_marketing_name(self, marketing_name):
+        with self._lock:
+            return list(self._by_marketing_name.get(str(marketing_name), []))
+
+    def get_by_manufacturer(self, manufacturer):
+        with self._lock:
+            return list(self._by_manufacturer.get(manufacturer, []))
+
+    def get_by_model_name(self, model_name):
+        with self._lock:
+            return list(self._by_model_name.get(model_name, []))
+
+    def upsert(self, entries):
+        # returns the number of new or changed entries
+        changed = 0
+        with self._lock:
+            for entry in entries:
+                if self._upsert(entry):
+                    self._pending[NfcDatabase.key_of(entry)] = entry
+                    changed += 1
+        return changed
+
+    def reload_if_changed(self):
+        # reads the file again if somebody else wrote it since it was loaded, the changes not saved yet are kept on top
+        with self._lock:
+            if self._file_stat() == self._loaded_stat:
+                return False
+            pending = self._pending
+            self.load()
+            for entry in pending.values():
+                self._upsert(entry)
+            self._pending = pending
+            return True
+
+    def save(self, compact=False):
+        with self._lock:
+            if len(self._pending) == 0 and self._loaded_stat is not None:
+                return
+            os.makedirs(os.path.dirname(self.path_to_file), exist_ok=True)
+            with PipelineMetrics.span("db_write"), LockFile(self.path_to_file + ".lock",
+                                                            NfcDatabase.LOCK_TIMEOUT_SECONDS):
+                # merge our changes into the content another run wrote in the meantime
+                self.reload_if_changed()
+                self._write_atomic(compact)
+                self._pending = {}
+                self._loaded_stat = self._file_stat()
+
+    def _write_atomic(self, compact):
+        with AtomicFile(self.path_to_file, 'w', encoding='utf-8', sync=True) as f:
+            if compact:
+                json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+            else:
+                json.dump(self.entries, f, ensure_ascii=False, indent=5)
+            f.write("\n")
+
+
+class AtomicFile:
+    # writes into a temporary file with a unique name next to the target and replaces the target if the block
+    # succeeds - concurrent writers never share a temporary file and readers never see a partial file
+    def __init__(self, path_to_file, mode="w", encoding=None, sync=False):
+        self.path_to_file = path_to_file
+        self.mode = mode
+        self.encoding = encoding
+        self.sync = sync
+        self.tmp_file = None
+        self._file = None
+
+    def __enter__(self):
+        # ends with .part, so the image folders skip it like a download in progress
+        fd, self.tmp_file = tempfile.mkstemp(prefix="." + os.path.basename(self.path_to_file) + ".", suffix=".part",
+                                             dir=os.path.dirname(self.path_to_file) or ".")
+        self._file = os.fdopen(fd, self.mode, encoding=self.encoding)
+        return self._file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None and self.sync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                os.replace(self.tmp_file, self.path_to_file)
+        finally:
+            if os.path.exists(self.tmp_file):
+                os.remove(self.tmp_file)
+
+
+class LockFile:
+    # lock file which works across processes on every platform, a stale lock of a crashed run is taken over
+    def __init__(self, path_to_lock, timeout_seconds):
+        self.path_to_lock = path_to_lock
+        self.timeout_seconds = timeout_seconds
+
+    def __enter__(self):
+        start = time.monotonic()
+        while True:
+            try:
+                fd = os.open(self.path_to_lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path_to_lock) > self.timeout_seconds:
+                        os.remove(self.path_to_lock)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() - start > self.timeout_seconds:
+                    raise TimeoutError("Lock " + self.path_to_lock + " could not be acquired")
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            os.remove(self.path_to_lock)
+        except OSError:
+            pass
@@ -0,0 +1,143 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import time
+import socket
+from baselineFunctions import BaselineFunctions as base
+from imageCache import ImageCache
+from imageDownloader import ImageDownloader
+from nfcDatabase import NfcDatabase
+from pipelineMetrics import PipelineMetrics
+from vendorCatalog import VendorCatalog
+
+"""
+NfcJobs runs the vendors over a JobQueue in three roles:
+coordinate scrapes the vendor pages and queues a task per phone image to analyze,
+work claims tasks, downloads and analyzes the image and posts the result - any number of workers on any host with
+access to the queue,
+merge writes the posted results into nfc_positions.json, it can run repeatedly while the workers are busy.
+"""
+class NfcJobs:
+    IMAGE_DIR = "queue/images/"
+    POLL_SECONDS = 5
+
+    @staticmethod
+    def _vendor_class(vendor):
+        # imported here, runNfcLocalization imports this module only for the queue roles
+        from runNfcLocalization import RunNfcLocalization
+        return RunNfcLocalization.vendor_class(vendor)
+
+    @staticmethod
+    def coordinate(queue, vendors, db_path, db_file_name, force=False, catalog_cache_dir=None):
+        queued = 0
+        for vendor in vendors:
+            vendor_class = NfcJobs._vendor_class(vendor)
+            catalog = VendorCatalog(vendor.capitalize(), db_path, db_file_name, catalog_cache_dir, force)
+            downloads, extra_args = vendor_class.scrape(db_path, db_file_name, catalog)
+            # the catalog is saved when the tasks are queued, so tasks which failed since then are retried here - also
+            # if the vendor is skipped, its page does not tell about them
+            retried = queue.retry_failed(vendor)
+            if retried > 0:
+                print(vendor + ": " + str(retried) + " failed tasks queued again")
+                queued += retried
+            if catalog.unchanged():
+                print(vendor + ": the phones on the vendor page did not change since the last run, skipped")
+                continue
+            catalog.print_diff()
+            tasks = []
+            for path, phone_src, model_name, web_prefix in downloads:
+                file_name = str(model_name) + ".webp"
+                tasks.append({"vendor": vendor, "file_name": file_name, "url": web_prefix + str(phone_src),
+                              "args": list(extra_args(file_name)) if extra_args is not None else []})
+            vendor_queued = queue.add(tasks)
+            print(vendor + ": " + str(vendor_queued) + " of " + str(len(tasks)) + " tasks queued")
+            queued += vendor_queued
+            for _, _, model_name, _ in downloads:
+                catalog.set_state(str(model_name), VendorCatalog.QUEUED)
+            # the queued tasks are kept by the queue, the next run only queues what changed after this one
+            catalog.save()
+        return queued
+
+    @staticmethod
+    def work(queue, worker_id=None, image_dir=None, wait=False, edge_pyramid_levels=None):
+        # runs until no task is pending or leased, with wait until it is stopped - returns the number of tasks done
+        worker_id = worker_id or socket.gethostname() + ":" + str(os.getpid())
+        image_dir = image_dir or os.path.join(NfcJobs.IMAGE_DIR, worker_id.replace(":", "_"), "")
+        os.makedirs(image_dir, exist_ok=True)
+        cache = ImageCache.get_default() if ImageDownloader.USE_CACHE else None
+        done = 0
+        while True:
+            task = queue.claim(worker_id)
+            if task is None:
+                counts = queue.counts()
+                if not wait and counts.get("pending", 0) + counts.get("leased", 0) == 0:
+                    break
+                # the leases of the other workers might still run out
+                time.sleep(NfcJobs.POLL_SECONDS)
+                continue
+            path_to_file = os.path.join(image_dir, task["file_name"])
+            try:
+                if not ImageDownloader.download(task["url"], path_to_file, cache=cache):
+                    raise OSError("Download of " + task["url"] + " failed")
+                result = NfcJobs._vendor_class(task["vendor"])._analyze_image(
+                    image_dir, task["file_name"], *task["args"], edge_pyramid_levels=edge_pyramid_levels)
+                if result is None:
+                    raise ValueError(task["file_name"] + " could not be decoded")
+                if not queue.complete(task["id"], worker_id, result):
+                    print("Lease of " + task["file_name"] + " ran out, the result of another worker counts")
+                done += 1
+            except Exception as e:
+                print("Error: Task " + task["vendor"] + "/" + task["file_name"] + " failed: " + repr(e))
+                PipelineMetrics.count("task_failures")
+                queue.fail(task["id"], worker_id, repr(e))
+            finally:
+                if os.path.exists(path_to_file):
+                    os.remove(path_to_file)
+        if cache is not None:
+            cache.evict()
+        print(worker_id + ": " + str(done) + " tasks done")
+        return done
+
+    @staticmethod
+    def merge(queue, db_path, db_file_name, device_list_cache_dir=None, dry_run=False, compact=False):
+        tasks = queue.unmerged()
+        if len(tasks) == 0:
+            print("No new results to merge")
+            return 0
+        google_device_list = base.load_google_play_device_list(device_list_cache_dir)
+        database = NfcDatabase.get(db_path, db_file_name)
+        changed = 0
+        for task in tasks:
+            entry = NfcJobs._vendor_class(task["vendor"])._to_entry(google_device_list, task["file_name"],
+                                                                     task["result"])
+            if entry is None:
+                PipelineMetrics.count("chips_not_located")
+            elif dry_run:
+                print("Dry run, not saved: " + json.dumps(entry, ensure_ascii=False))
+            else:
+                changed += database.upsert([entry])
+        if not dry_run:
+            database.save(compact)
+            queue.mark_merged([task["id"] for task in tasks])
+        print(str(len(tasks)) + " results merged, " + str(changed) + " new or changed entries")
+        return changed
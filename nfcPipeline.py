@@ -0,0 +1,242 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from baselineFunctions import BaselineFunctions as base
+from parallelAnalysis import ParallelAnalysis
+from analysisCache import AnalysisCache
+from nfcDatabase import NfcDatabase
+from pipelineMetrics import PipelineMetrics
+from renderGroups import RenderGroups
+
+"""
+NfcPipeline streams the images of a vendor from the download into nfc_positions.json. A download thread puts every
+image into a bounded queue as soon as it is on disk, so the analysis overlaps with the downloads still running.
+Every result is upserted into the database right away (saved every COMMIT_EVERY changes) and the image is deleted
+afterwards, so only the images in the queue and in the workers are held at a time.
+With DEDUP_RENDERS identical images listed under several names are only analyzed once (RenderGroups), the others get
+the same result.
+"""
+class NfcPipeline:
+    QUEUE_SIZE = 16
+    COMMIT_EVERY = 10
+    DEDUP_RENDERS = True
+
+    def __init__(self, analysis_cache, image_path, db_path, db_file_name, commit_every=None, queue_size=None,
+                 dry_run=False, dedup_renders=None, compact=False):
+        self.analysis_cache = analysis_cache
+        self.image_path = image_path
+        self.database = NfcDatabase.get(db_path, db_file_name)
+        self.commit_every = commit_every or NfcPipeline.COMMIT_EVERY
+        self.queue_size = queue_size or NfcPipeline.QUEUE_SIZE
+        # a dry run prints the entries instead of saving them, compact saves them without indentation
+        self.dry_run = dry_run
+        self.compact = compact
+        self.images = 0
+        self.changed = 0
+        # file names which got an entry in this run and which were analyzed without finding the chip
+        self.located = set()
+        self.not_found = set()
+        self._uncommitted = 0
+        # file name -> time the image was ready, for the latency of every image until its entry is committed
+        self._arrivals = {}
+        dedup_renders = dedup_renders if dedup_renders is not None else NfcPipeline.DEDUP_RENDERS
+        self.render_groups = RenderGroups() if dedup_renders else None
+
+    def run(self, downloads, analyze_function, to_entry, extra_args=None, workers=1):
+        # analyze_function(image_path, file_name, *extra_args(file_name)) is called for every image without a cached
+        # result, to_entry(file_name, result) returns the database entry or None
+        if workers <= 1:
+            for file_name, key, args in self._uncached_images(downloads, to_entry, extra_args):
+                result = ParallelAnalysis.map_images(analyze_function, [(file_name, args)])[0]
+                self._commit(file_name, key, result, to_entry)
+        else:
+            # started from a fork server, the producer and download threads below must not be forked with their locks
+            with ParallelAnalysis.executor(workers) as executor:
+                running = {}
+                for file_name, key, args in self._uncached_images(downloads, to_entry, extra_args):
+                    # at most two images per worker are decoded at a time
+                    if len(running) >= 2 * workers:
+                        self._commit_done(running, to_entry, FIRST_COMPLETED)
+                    future = executor.submit(PipelineMetrics.run_measured, analyze_function, *args)
+                    running[future] = (file_name, key)
+                while len(running) > 0:
+                    self._commit_done(running, to_entry, FIRST_COMPLETED)
+        self._finish()
+
+    def run_batched(self, downloads, analyze_batch_function, to_entry, extra_args=None, batch_size=8, workers=1):
+        # analyze_batch_function([(image_path, file_name, *extra_args(file_name))], executor) returns the results of a
+        # batch, executor are the worker processes of all batches (None with one worker)
+        executor = ParallelAnalysis.executor(workers) if workers > 1 else None
+        try:
+            batch = []
+            for file_name, key, args in self._uncached_images(downloads, to_entry, extra_args):
+                batch.append((file_name, key, args))
+                if len(batch) >= batch_size:
+                    self._commit_batch(batch, analyze_batch_function, to_entry, executor)
+                    batch = []
+            if len(batch) > 0:
+                self._commit_batch(batch, analyze_batch_function, to_entry, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self._finish()
+
+    def _produce(self, downloads, images):
+        try:
+            seen = set()
+            for path_to_file in base.download_images_as_completed(downloads):
+                seen.add(os.path.basename(path_to_file))
+                images.put(os.path.basename(path_to_file))
+            # images left over from an interrupted run
+            for file_name in os.listdir(self.image_path):
+                if file_name not in seen and not file_name.endswith(".part"):
+                    images.put(file_name)
+        except Exception as e:
+            print("Error: Loading the images into " + self.image_path + " failed: " + repr(e))
+        finally:
+            images.put(None)
+
+    def _uncached_images(self, downloads, to_entry, extra_args):
+        # yields (file_name, cache key, args) of the images which have to be analyzed, cached results are committed
+        if not os.path.isdir(self.image_path):
+            os.makedirs(self.image_path)
+        images = queue.Queue(maxsize=self.queue_size)
+        producer = threading.Thread(target=self._produce, args=(downloads, images), daemon=True)
+        producer.start()
+        while True:
+            file_name = images.get()
+            if file_name is None:
+                break
+            self.images += 1
+            self._arrivals[file_name] = time.perf_counter()
+            PipelineMetrics.count("images")
+            extra = tuple(extra_args(file_name)) if extra_args is not None else ()
+            try:
+                key = AnalysisCache.key_of(os.path.join(self.image_path, file_name), *extra)
+            except OSError:
+                print("Error: Image " + file_name + " could not be read")
+                continue
+            result = self.analysis_cache.get(key)
+            if result is not None:
+                self.analysis_cache.hits += 1
+                PipelineMetrics.count("analysis_cache_hits")
+                self._commit(file_name, None, result, to_entry)
+            else:
+                self.analysis_cache.misses += 1
+                PipelineMetrics.count("analysis_cache_misses")
+                representative = None
+                if self.render_groups is not None:
+                    representative = self.render_groups.add(file_name, key)
+                if representative is None:
+                    yield file_name, key, (self.image_path, file_name) + extra
+                    continue
+                # the same image was analyzed already or is being analyzed under another name
+                PipelineMetrics.count("renders_deduplicated")
+                resolved, result = self.render_groups.result_of(representative)
+                if resolved:
+                    self._commit(file_name, None, result, to_entry)
+                else:
+                    self.render_groups.wait_for(representative, file_name)
+        producer.join()
+
+    def _commit_done(self, running, to_entry, return_when):
+        done, _ = wait(running, return_when=return_when)
+        for future in done:
+            file_name, key = running.pop(future)
+            try:
+                result, metrics = future.result()
+                PipelineMetrics.merge(metrics)
+            except Exception as e:
+                print("Error: Analysis of " + str(file_name) + " failed: " + repr(e))
+                PipelineMetrics.count("analysis_failures")
+                result = None
+            self._commit(file_name, key, result, to_entry)
+
+    def _commit_batch(self, batch, analyze_batch_function, to_entry, executor=None):
+        try:
+            results = analyze_batch_function([args for _, _, args in batch], executor)
+        except Exception as e:
+            print("Error: Analysis of " + str([file_name for file_name, _, _ in batch]) + " failed: " + repr(e))
+            PipelineMetrics.count("analysis_failures", len(batch))
+            results = [None] * len(batch)
+        for (file_name, key, args), result in zip(batch, results):
+            self._commit(file_name, key, result, to_entry)
+
+    def _commit(self, file_name, key, result, to_entry):
+        if result is not None:
+            if key is not None:
+                self.analysis_cache.put(key, result)
+            entry = to_entry(file_name, result)
+            if entry is None:
+                PipelineMetrics.count("chips_not_located")
+                self.not_found.add(file_name)
+            else:
+                self.located.add(file_name)
+            if entry is not None and self.dry_run:
+                print("Dry run, not saved: " + json.dumps(entry, ensure_ascii=False))
+            elif entry is not None:
+                changed = self.database.upsert([entry])
+                PipelineMetrics.count("entries_changed", changed)
+                self.changed += changed
+                self._uncommitted += changed
+                if self._uncommitted >= self.commit_every:
+                    self._save()
+        # the image is not needed anymore
+        try:
+            os.remove(os.path.join(self.image_path, file_name))
+        except OSError:
+            pass
+        if file_name in self._arrivals:
+            PipelineMetrics.add_span("image_latency", time.perf_counter() - self._arrivals.pop(file_name))
+        if self.render_groups is not None:
+            for waiting_file_name in self.render_groups.resolve(file_name, result):
+                self._commit(waiting_file_name, None, result, to_entry)
+
+    def not_located(self, downloads):
+        # model names of the downloads which were analyzed without finding the chip
+        return [str(model_name) for _, _, model_name, _ in downloads if str(model_name) + ".webp" in self.not_found]
+
+    def failed(self, downloads):
+        # model names of the downloads without a result, e.g. the download or the analysis failed
+        return [str(model_name) for _, _, model_name, _ in downloads
+                if str(model_name) + ".webp" not in self.located and str(model_name) + ".webp" not in self.not_found]
+
+    def _save(self):
+        # a dry run leaves the database file alone, also if it does not exist yet
+        if not self.dry_run:
+            try:
+                self.database.save(self.compact)
+            except OSError:
+                print("Error: Path " + str(self.database.path_to_file) + " could not be reached")
+        self.analysis_cache.save()
+        self._uncommitted = 0
+
+    def _finish(self):
+        self._save()
+        print(self.analysis_cache.vendor + ": " + str(self.images) + " images, " + str(self.changed) +
+              " new or changed entries, analysis cache " + str(self.analysis_cache.hits) + " hits, " +
+              str(self.analysis_cache.misses) + " misses")
@@ -0,0 +1,160 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import bisect
+import sqlite3
+
+"""
+NfcPositionLookup maps a model name as reported by the phone (Build.MODEL) to its entry of nfc_positions.json.
+Names are compared case and whitespace insensitive. A model name is looked up in this order: exact model name, exact
+marketing name (e.g. "Pixel 8"), longest known model name the query starts with (e.g. "SM-S901B/DS" -> "SM-S901B").
+export_sqlite writes the index into a small SQLite file which NfcPositionSqlite queries without parsing any json.
+"""
+class NfcPositionLookup:
+    # a known model name has to be at least this long to match as prefix of a query
+    MIN_PREFIX_LENGTH = 4
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._by_model_name = {}
+        self._by_marketing_name = {}
+        for entry in self.entries:
+            for model_name in entry["modelNames"]:
+                self._by_model_name.setdefault(NfcPositionLookup.normalize(model_name), []).append(entry)
+            self._by_marketing_name.setdefault(NfcPositionLookup.normalize(entry["marketingName"]), []).append(entry)
+        self._sorted_model_names = sorted(self._by_model_name)
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(str(name).split()).lower()
+
+    @staticmethod
+    def from_json(path_to_file):
+        with open(path_to_file, "r", encoding="utf-8") as f:
+            return NfcPositionLookup(json.load(f))
+
+    @staticmethod
+    def from_database(database):
+        return NfcPositionLookup(database.entries)
+
+    def lookup(self, model_name):
+        # the best matching entry or None
+        entries = self.lookup_all(model_name)
+        return entries[0] if len(entries) > 0 else None
+
+    def lookup_all(self, model_name):
+        name = NfcPositionLookup.normalize(model_name)
+        entries = self._by_model_name.get(name) or self._by_marketing_name.get(name)
+        if entries:
+            return list(entries)
+        for length in range(len(name) - 1, NfcPositionLookup.MIN_PREFIX_LENGTH - 1, -1):
+            entries = self._by_model_name.get(name[:length])
+            if entries:
+                return list(entries)
+        return []
+
+    def find_by_prefix(self, prefix):
+        # all entries with a model name starting with prefix, e.g. "SM-S90"
+        prefix = NfcPositionLookup.normalize(prefix)
+        start = bisect.bisect_left(self._sorted_model_names, prefix)
+        entries = []
+        for model_name in self._sorted_model_names[start:]:
+            if not model_name.startswith(prefix):
+                break
+            entries.extend(entry for entry in self._by_model_name[model_name] if entry not in entries)
+        return entries
+
+    def export_sqlite(self, path_to_file):
+        # written next to the target and replaced atomically, the file can be shipped and opened read only
+        tmp_file = path_to_file + ".part"
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        connection = sqlite3.connect(tmp_file)
+        try:
+            connection.execute("CREATE TABLE entries (id INTEGER PRIMARY KEY, manufacturer TEXT, marketing_name TEXT, "
+                               "model_names TEXT, x0 REAL, y0 REAL, x1 REAL, y1 REAL)")
+            # kind 0: model name, kind 1: marketing name - position keeps the order of the entries per name
+            connection.execute("CREATE TABLE names (name TEXT, kind INTEGER, position INTEGER, entry_id INTEGER, "
+                               "PRIMARY KEY (name, kind, position)) WITHOUT ROWID")
+            connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(i, entry["manufacturer"], entry["marketingName"],
+                                     json.dumps(entry["modelNames"], ensure_ascii=False), entry["nfcPos"]["x0"],
+                                     entry["nfcPos"]["y0"], entry["nfcPos"]["x1"], entry["nfcPos"]["y1"])
+                                    for i, entry in enumerate(self.entries)])
+            ids = {id(entry): i for i, entry in enumerate(self.entries)}
+            names = []
+            for kind, index in [(0, self._by_model_name), (1, self._by_marketing_name)]:
+                for name, entries in index.items():
+                    names.extend((name, kind, position, ids[id(entry)]) for position, entry in enumerate(entries))
+            connection.executemany("INSERT INTO names VALUES (?, ?, ?, ?)", names)
+            connection.commit()
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+        os.replace(tmp_file, path_to_file)
+
+
+class NfcPositionSqlite:
+    # same lookups as NfcPositionLookup on a file written by NfcPositionLookup.export_sqlite
+    def __init__(self, path_to_file):
+        self.connection = sqlite3.connect("file:" + path_to_file + "?mode=ro", uri=True, check_same_thread=False)
+        self.connection.execute("PRAGMA mmap_size = 16777216")
+
+    def close(self):
+        self.connection.close()
+
+    def lookup(self, model_name):
+        entries = self.lookup_all(model_name)
+        return entries[0] if len(entries) > 0 else None
+
+    def lookup_all(self, model_name):
+        name = NfcPositionLookup.normalize(model_name)
+        rows = self._entries("n.name = ? AND n.kind = 0", (name,)) or self._entries("n.name = ? AND n.kind = 1",
+                                                                                    (name,))
+        if rows:
+            return rows
+        prefixes = [name[:length] for length in range(len(name) - 1, NfcPositionLookup.MIN_PREFIX_LENGTH - 1, -1)]
+        if len(prefixes) == 0:
+            return []
+        longest = self.connection.execute("SELECT name FROM names WHERE kind = 0 AND name IN (" +
+                                          ",".join("?" * len(prefixes)) + ") ORDER BY length(name) DESC LIMIT 1",
+                                          prefixes).fetchone()
+        return self._entries("n.name = ? AND n.kind = 0", (longest[0],)) if longest is not None else []
+
+    def find_by_prefix(self, prefix):
+        prefix = NfcPositionLookup.normalize(prefix)
+        # every name starting with prefix sorts between prefix and prefix + the highest character
+        entries = self._entries("n.kind = 0 AND n.name >= ? AND n.name < ?", (prefix, prefix + "\U0010ffff"))
+        unique = []
+        for entry in entries:
+            if entry not in unique:
+                unique.append(entry)
+        return unique
+
+    def _entries(self, condition, parameters):
+        rows = self.connection.execute("SELECT e.manufacturer, e.marketing_name, e.model_names, e.x0, e.y0, e.x1, "
+                                       "e.y1 FROM names n JOIN entries e ON e.id = n.entry_id WHERE " + condition +
+                                       " ORDER BY n.name, n.position", parameters).fetchall()
+        return [{"manufacturer": manufacturer, "marketingName": marketing_name, "modelNames": json.loads(model_names),
+                 "nfcPos": {"x0": x0, "y0": y0, "x1": x1, "y1": y1}}
+                for manufacturer, marketing_name, model_names, x0, y0, x1, y1 in rows]
@@ -0,0 +1,259 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import time
+import queue
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from googlePlayDeviceList import GooglePlayDeviceList
+from nfcDatabase import NfcDatabase
+from nfcPositionLookup import NfcPositionLookup
+
+"""
+NfcService keeps one process running with the nfc positions, the Google device list and the ocr models loaded and
+serves the lookups over HTTP:
+    GET  /lookup?model=SM-S901B[&all=1]   the entry (with all=1 every matching entry) of a model name, 404 if unknown
+    POST /refresh[?vendor=samsung][&force=1]   queues an update of the vendor (of all vendors without vendor)
+    GET  /status   loaded entries, number of lookups and the state of the updates
+The vendor updates run one after another in a background thread of the same process, so they use the warm models and
+device list. A lookup never waits for an update: the lookup index is replaced as a whole when nfc_positions.json
+changed, by an update of the service or by another run. With refresh_interval_hours all vendors are updated regularly.
+The service has no authentication, it listens on 127.0.0.1 unless another host is given.
+"""
+class NfcService:
+    POLL_SECONDS = 5
+
+    def __init__(self, vendors, options, image_cache_dir=None, metrics=None, refresh_interval_hours=None):
+        # options are the keyword arguments of the vendor main functions, see RunNfcLocalization.main
+        self.vendors = list(vendors)
+        self.options = dict(options)
+        self.image_cache_dir = image_cache_dir
+        self.metrics = metrics
+        self.refresh_interval_seconds = refresh_interval_hours * 3600 if refresh_interval_hours else None
+        self.path_to_file = os.path.join(self.options["db_path"], self.options["db_file_name"])
+        self.lookup = NfcPositionLookup([])
+        self._loaded_stat = None
+        self._loaded_at = None
+        self._lookups = 0
+        self._lock = threading.Lock()
+        # vendor -> force of the queued updates, the queue keeps their order
+        self._queued = {}
+        self._refresh_queue = queue.Queue()
+        self._refreshing = None
+        # vendor -> {"started", "finished", "result"} of the last update
+        self._refreshes = {}
+        self._next_scheduled = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.reload_if_changed()
+        self._warm_up()
+        if self.refresh_interval_seconds is not None:
+            self._next_scheduled = time.time() + self.refresh_interval_seconds
+        self._threads = [threading.Thread(target=self._run_refreshes, name="refresh", daemon=True),
+                         threading.Thread(target=self._watch, name="watch", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._refresh_queue.put(None)
+        if self._refreshing is not None:
+            print("Waiting for the update of " + self._refreshing)
+        for thread in self._threads:
+            thread.join()
+
+    def _warm_up(self):
+        # failures are printed only, the updates load what is missing again
+        try:
+            GooglePlayDeviceList.load(self.options.get("device_list_cache_dir"))
+        except Exception as e:
+            print("Error: Device list could not be loaded: " + repr(e))
+        if "google" in self.vendors:
+            try:
+                # imported here, the ocr models are only loaded if the service updates Google
+                from ocrReaderPool import OcrReaderPool
+                OcrReaderPool.get_reader()
+            except Exception as e:
+                print("Error: Ocr models could not be loaded: " + repr(e))
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path_to_file)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload_if_changed(self):
+        # True if the lookup index was replaced
+        stat = self._file_stat()
+        if stat is None or stat == self._loaded_stat:
+            return False
+        try:
+            lookup = NfcPositionLookup.from_json(self.path_to_file)
+        except (OSError, ValueError) as e:
+            # e.g. the file was replaced while reading it, the next poll tries again
+            print("Error: DataBaseFile " + self.path_to_file + " could not be loaded: " + repr(e))
+            return False
+        # one assignment, a running lookup keeps the index it started with
+        self.lookup = lookup
+        self._loaded_stat = stat
+        self._loaded_at = time.time()
+        print("Loaded " + str(len(lookup.entries)) + " entries from " + self.path_to_file)
+        return True
+
+    def find(self, model_name, all_entries=False):
+        with self._lock:
+            self._lookups += 1
+        lookup = self.lookup
+        return lookup.lookup_all(model_name) if all_entries else lookup.lookup(model_name)
+
+    def request_refresh(self, vendors=None, force=False):
+        # returns the vendors which were queued, a vendor already waiting is not queued twice
+        queued = []
+        with self._lock:
+            for vendor in vendors or self.vendors:
+                if vendor in self._queued:
+                    self._queued[vendor] = self._queued[vendor] or force
+                    continue
+                self._queued[vendor] = force
+                self._refresh_queue.put(vendor)
+                queued.append(vendor)
+        return queued
+
+    def _run_refreshes(self):
+        # imported here, RunNfcLocalization is the entry point that imports this module
+        from runNfcLocalization import RunNfcLocalization
+        while not self._stop.is_set():
+            vendor = self._refresh_queue.get()
+            if vendor is None or self._stop.is_set():
+                break
+            with self._lock:
+                force = self._queued.pop(vendor)
+                self._refreshing = vendor
+                state = {"started": time.time(), "finished": None, "result": None}
+                self._refreshes[vendor] = state
+            options = dict(self.options, force=True) if force else self.options
+            try:
+                # a new device list is only loaded if google published one
+                GooglePlayDeviceList.revalidate(self.options.get("device_list_cache_dir"))
+                # the entries this process holds are compared with the file another run might have written since
+                NfcDatabase.get(self.options["db_path"], self.options["db_file_name"]).reload_if_changed()
+                RunNfcLocalization._run_vendor(vendor, options, self.image_cache_dir, self.metrics)
+                result = "ok"
+            except Exception as e:
+                print("Error: Update of " + vendor + " failed: " + repr(e))
+                result = "failed: " + repr(e)
+            with self._lock:
+                state["result"] = result
+                state["finished"] = time.time()
+                self._refreshing = None
+            self.reload_if_changed()
+
+    def _watch(self):
+        # picks up changes of the database file by other runs and queues the scheduled updates
+        while not self._stop.wait(NfcService.POLL_SECONDS):
+            self.reload_if_changed()
+            if self._next_scheduled is not None and time.time() >= self._next_scheduled:
+                self._next_scheduled = time.time() + self.refresh_interval_seconds
+                print("Scheduled update of " + ", ".join(self.vendors))
+                self.request_refresh()
+
+    def status(self):
+        with self._lock:
+            return {"file": self.path_to_file, "entries": len(self.lookup.entries), "loaded_at": self._loaded_at,
+                    "lookups": self._lookups, "refreshing": self._refreshing, "queued": list(self._queued),
+                    "refreshes": {vendor: dict(state) for vendor, state in self._refreshes.items()},
+                    "next_scheduled": self._next_scheduled}
+
+    def serve(self, host="127.0.0.1", port=8080):
+        # runs until it is interrupted, the port is bound first so a port in use fails before the warm up
+        server = ThreadingHTTPServer((host, port), NfcServiceHandler)
+        self.start()
+        server.daemon_threads = True
+        server.service = self
+        print("Serving nfc positions on http://" + host + ":" + str(server.server_address[1]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stop()
+        return True
+
+
+class NfcServiceHandler(BaseHTTPRequestHandler):
+    # keep-alive, every response has a Content-Length
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with Nagle every response would wait for the delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # no line per lookup
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        service = self.server.service
+        if url.path == "/lookup":
+            if "model" not in query:
+                return self._send(400, {"error": "model is missing"})
+            model_name = query["model"][0]
+            if query.get("all", ["0"])[0] == "1":
+                return self._send(200, {"model": model_name, "entries": service.find(model_name, True)})
+            entry = service.find(model_name)
+            if entry is None:
+                return self._send(404, {"error": "unknown model", "model": model_name})
+            return self._send(200, entry)
+        if url.path == "/status":
+            return self._send(200, service.status())
+        return self._send(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        from runNfcLocalization import RunNfcLocalization
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        # a body is not used, but has to be read for the next request on this connection
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            self.rfile.read(length)
+        if url.path != "/refresh":
+            return self._send(404, {"error": "unknown path"})
+        vendors = query.get("vendor")
+        unknown = [vendor for vendor in vendors or [] if vendor not in RunNfcLocalization.VENDORS]
+        if len(unknown) > 0:
+            return self._send(400, {"error": "unknown vendor", "vendors": unknown})
+        queued = self.server.service.request_refresh(vendors, query.get("force", ["0"])[0] == "1")
+        return self._send(202, {"queued": queued})
@@ -0,0 +1,116 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import threading
+import time
+import numpy as np
+import cv2 as cv
+from pipelineMetrics import PipelineMetrics
+
+"""
+OcrReaderPool keeps one easyocr.Reader per (languages, gpu) combination for the lifetime of the process,
+so the detection and recognition weights are only loaded once and stay warm across images and runs.
+read_text_batched runs the text detection for many images in one call per batch.
+easyocr (and torch with it) is only imported when the first reader is created.
+"""
+class OcrReaderPool:
+    _readers = {}
+    _lock = threading.Lock()
+    _timings = {"load_count": 0, "load_seconds": 0.0, "inference_count": 0, "inference_seconds": 0.0}
+
+    @staticmethod
+    def get_reader(languages=('en',), gpu=False):
+        key = (tuple(languages), gpu)
+        with OcrReaderPool._lock:
+            reader = OcrReaderPool._readers.get(key)
+            if reader is None:
+                start = time.perf_counter()
+                import easyocr
+                reader = easyocr.Reader(list(languages), gpu=gpu)
+                load_seconds = time.perf_counter() - start
+                OcrReaderPool._readers[key] = reader
+                OcrReaderPool._timings["load_count"] += 1
+                OcrReaderPool._timings["load_seconds"] += load_seconds
+                print("Loaded ocr models for " + str(list(languages)) + " in " + str(round(load_seconds, 2)) + "s")
+        return reader
+
+    @staticmethod
+    def read_text(img, allowlist=None, languages=('en',), gpu=False):
+        reader = OcrReaderPool.get_reader(languages, gpu)
+        start = time.perf_counter()
+        with PipelineMetrics.span("ocr"):
+            result_list = reader.readtext(img, allowlist=allowlist)
+        inference_seconds = time.perf_counter() - start
+        with OcrReaderPool._lock:
+            OcrReaderPool._timings["inference_count"] += 1
+            OcrReaderPool._timings["inference_seconds"] += inference_seconds
+        return result_list
+
+    @staticmethod
+    def read_text_batched(imgs, allowlist=None, batch_size=8, languages=('en',), gpu=False):
+        # returns one result list per image, in the order of imgs
+        reader = OcrReaderPool.get_reader(languages, gpu)
+        result_lists = [None] * len(imgs)
+        # images of similar size share a batch, so little padding is needed
+        order = sorted(range(len(imgs)), key=lambda i: imgs[i].shape[:2])
+        for start_index in range(0, len(order), max(1, batch_size)):
+            batch = order[start_index:start_index + max(1, batch_size)]
+            height = max(imgs[i].shape[0] for i in batch)
+            width = max(imgs[i].shape[1] for i in batch)
+            padded_imgs = [OcrReaderPool._pad(imgs[i], height, width) for i in batch]
+            start = time.perf_counter()
+            with PipelineMetrics.span("ocr_batch"):
+                if hasattr(reader, "readtext_batched"):
+                    batch_result_lists = reader.readtext_batched(padded_imgs, allowlist=allowlist,
+                                                                 batch_size=len(batch))
+                else:
+                    # easyocr without batched inference
+                    batch_result_lists = [reader.readtext(img, allowlist=allowlist) for img in padded_imgs]
+            inference_seconds = time.perf_counter() - start
+            with OcrReaderPool._lock:
+                OcrReaderPool._timings["inference_count"] += len(batch)
+                OcrReaderPool._timings["inference_seconds"] += inference_seconds
+            for i, result_list in zip(batch, batch_result_lists):
+                result_lists[i] = result_list
+        return result_lists
+
+    @staticmethod
+    def _pad(img, height, width):
+        # a batch needs images of the same size, padding at the bottom and right keeps the coordinates of the text
+        if img.shape[0] == height and img.shape[1] == width:
+            return img
+        border_value = int(np.median(np.concatenate([img[0], img[-1], img[:, 0], img[:, -1]])))
+        return cv.copyMakeBorder(img, 0, height - img.shape[0], 0, width - img.shape[1], cv.BORDER_CONSTANT,
+                                 value=border_value)
+
+    @staticmethod
+    def get_timings():
+        with OcrReaderPool._lock:
+            timings = dict(OcrReaderPool._timings)
+        count = timings["inference_count"]
+        timings["inference_seconds_avg"] = timings["inference_seconds"] / count if count > 0 else 0.0
+        return timings
+
+    @staticmethod
+    def release():
+        # drop all loaded models, e.g. to free memory in a long-lived worker
+        with OcrReaderPool._lock:
+            OcrReaderPool._readers.clear()
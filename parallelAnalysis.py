@@ -0,0 +1,80 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pipelineMetrics import PipelineMetrics
+
+"""
+ParallelAnalysis runs the per-image analysis of the vendor pipelines in worker processes.
+Results are returned in the order of the tasks and a failing image only loses its own result.
+The workers are started from a fork server (spawned where it is not available) instead of forking the calling
+process: the pipelines start them while download threads run, a forked worker could inherit a lock held by one of them.
+"""
+class ParallelAnalysis:
+    @staticmethod
+    def default_workers():
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def executor(workers):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        # the workers do not inherit the state of this process, the metrics settings are passed on
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=PipelineMetrics.keep_samples,
+                                   initargs=(PipelineMetrics.keeps_samples(),))
+
+    @staticmethod
+    def map_images(analyze_function, tasks, workers=1, executor=None):
+        # tasks is a list of (file_name, args) - analyze_function has to be picklable (module level function
+        # or staticmethod) if workers > 1, an executor of the caller is used instead of starting new workers
+        if executor is not None and len(tasks) > 1:
+            return ParallelAnalysis._map_on(executor, analyze_function, tasks)
+        if workers <= 1 or len(tasks) <= 1:
+            return [ParallelAnalysis._run_isolated(analyze_function, file_name, args) for file_name, args in tasks]
+        with ParallelAnalysis.executor(min(workers, len(tasks))) as executor:
+            return ParallelAnalysis._map_on(executor, analyze_function, tasks)
+
+    @staticmethod
+    def _map_on(executor, analyze_function, tasks):
+        # the metrics recorded in a worker are sent back with the result
+        futures = [executor.submit(PipelineMetrics.run_measured, analyze_function, *args) for file_name, args in tasks]
+        results = []
+        for (file_name, args), future in zip(tasks, futures):
+            try:
+                result, metrics = future.result()
+                PipelineMetrics.merge(metrics)
+                results.append(result)
+            except Exception as e:
+                print("Error: Analysis of " + str(file_name) + " failed: " + repr(e))
+                PipelineMetrics.count("analysis_failures")
+                results.append(None)
+        return results
+
+    @staticmethod
+    def _run_isolated(analyze_function, file_name, args):
+        try:
+            return analyze_function(*args)
+        except Exception as e:
+            print("Error: Analysis of " + str(file_name) + " failed: " + repr(e))
+            PipelineMetrics.count("analysis_failures")
+            return None
@@ -0,0 +1,218 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+"""
+PipelineMetrics collects the time spent per stage (spans like "download", "edge_detection" or "ocr") and counters
+(e.g. cache hits or failures) and maxima (e.g. the peak memory of the workers) of a run in the current process. Work done in worker processes is measured with
+run_measured and merged into the process that started it. The totals can be written as a JSON report and as a
+Prometheus textfile. With keep_samples(True) every duration is kept as well and the report adds percentiles.
+"""
+class PipelineMetrics:
+    PROMETHEUS_PREFIX = "nfc_localization"
+
+    _lock = threading.Lock()
+    # name -> [count, seconds, max seconds]
+    _spans = {}
+    _counters = {}
+    # name -> largest value, e.g. the peak memory of the worker processes
+    _maxima = {}
+    _samples = None
+    _started = time.time()
+
+    @staticmethod
+    @contextmanager
+    def span(name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            PipelineMetrics.add_span(name, time.perf_counter() - start)
+
+    @staticmethod
+    def add_span(name, seconds):
+        with PipelineMetrics._lock:
+            span = PipelineMetrics._spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+            if PipelineMetrics._samples is not None:
+                PipelineMetrics._samples.setdefault(name, []).append(seconds)
+
+    @staticmethod
+    def keep_samples(keep=True):
+        # passed on to the worker processes when they are started, see ParallelAnalysis.executor
+        with PipelineMetrics._lock:
+            PipelineMetrics._samples = {} if keep else None
+
+    @staticmethod
+    def keeps_samples():
+        with PipelineMetrics._lock:
+            return PipelineMetrics._samples is not None
+
+    @staticmethod
+    def count(name, value=1):
+        with PipelineMetrics._lock:
+            PipelineMetrics._counters[name] = PipelineMetrics._counters.get(name, 0) + value
+
+    @staticmethod
+    def set_max(name, value):
+        with PipelineMetrics._lock:
+            PipelineMetrics._maxima[name] = max(PipelineMetrics._maxima.get(name, value), value)
+
+    @staticmethod
+    def peak_rss_mb():
+        # peak resident memory of this process, None where the resource module is missing (Windows)
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes on linux
+        return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    @staticmethod
+    def snapshot():
+        with PipelineMetrics._lock:
+            snapshot = {"spans": {name: list(span) for name, span in PipelineMetrics._spans.items()},
+                        "counters": dict(PipelineMetrics._counters), "maxima": dict(PipelineMetrics._maxima)}
+            if PipelineMetrics._samples is not None:
+                snapshot["samples"] = {name: list(samples) for name, samples in PipelineMetrics._samples.items()}
+            return snapshot
+
+    @staticmethod
+    def merge(snapshot):
+        with PipelineMetrics._lock:
+            for name, (count, seconds, max_seconds) in snapshot["spans"].items():
+                span = PipelineMetrics._spans.setdefault(name, [0, 0.0, 0.0])
+                span[0] += count
+                span[1] += seconds
+                span[2] = max(span[2], max_seconds)
+            for name, value in snapshot["counters"].items():
+                PipelineMetrics._counters[name] = PipelineMetrics._counters.get(name, 0) + value
+            for name, value in snapshot.get("maxima", {}).items():
+                PipelineMetrics._maxima[name] = max(PipelineMetrics._maxima.get(name, value), value)
+            if PipelineMetrics._samples is not None:
+                for name, samples in snapshot.get("samples", {}).items():
+                    PipelineMetrics._samples.setdefault(name, []).extend(samples)
+
+    @staticmethod
+    def reset():
+        with PipelineMetrics._lock:
+            PipelineMetrics._spans = {}
+            PipelineMetrics._counters = {}
+            PipelineMetrics._maxima = {}
+            if PipelineMetrics._samples is not None:
+                PipelineMetrics._samples = {}
+            PipelineMetrics._started = time.time()
+
+    @staticmethod
+    def run_measured(function, *args):
+        # runs in a worker process - returns the result and only the metrics recorded by this call
+        with PipelineMetrics._lock:
+            spans, counters, samples = PipelineMetrics._spans, PipelineMetrics._counters, PipelineMetrics._samples
+            PipelineMetrics._spans, PipelineMetrics._counters = {}, {}
+            if samples is not None:
+                PipelineMetrics._samples = {}
+        try:
+            result = function(*args)
+        finally:
+            # the parent can not see the memory of the workers of a fork server, every worker reports its own
+            peak_rss_mb = PipelineMetrics.peak_rss_mb()
+            if peak_rss_mb is not None:
+                PipelineMetrics.set_max("worker_peak_rss_mb", peak_rss_mb)
+            snapshot = PipelineMetrics.snapshot()
+            with PipelineMetrics._lock:
+                PipelineMetrics._spans, PipelineMetrics._counters = spans, counters
+                PipelineMetrics._samples = samples
+        return result, snapshot
+
+    @staticmethod
+    def report(labels=None):
+        snapshot = PipelineMetrics.snapshot()
+        spans = {}
+        for name, (count, seconds, max_seconds) in sorted(snapshot["spans"].items()):
+            spans[name] = {"count": count, "seconds": seconds, "max_seconds": max_seconds,
+                           "avg_seconds": seconds / count if count > 0 else 0.0}
+            samples = sorted(snapshot.get("samples", {}).get(name, []))
+            for percentile in ([50, 90, 99] if len(samples) > 0 else []):
+                spans[name]["p" + str(percentile) + "_seconds"] = PipelineMetrics._percentile(samples, percentile)
+        return {"labels": labels or {}, "started": PipelineMetrics._started,
+                "wall_seconds": time.time() - PipelineMetrics._started, "spans": spans,
+                "counters": dict(sorted(snapshot["counters"].items())),
+                "maxima": dict(sorted(snapshot["maxima"].items()))}
+
+    @staticmethod
+    def _percentile(sorted_samples, percentile):
+        # nearest rank
+        rank = -(-percentile * len(sorted_samples) // 100)
+        return sorted_samples[max(0, rank - 1)]
+
+    @staticmethod
+    def write_report(path_to_file, labels=None):
+        PipelineMetrics._write(path_to_file, json.dumps(PipelineMetrics.report(labels), indent=2) + "\n")
+
+    @staticmethod
+    def write_prometheus(path_to_file, labels=None):
+        # textfile for the node exporter, the file is replaced atomically so it is never read half written
+        report = PipelineMetrics.report(labels)
+        prefix = PipelineMetrics.PROMETHEUS_PREFIX
+        lines = []
+
+        def add(name, metric_type, samples):
+            lines.append("# TYPE " + prefix + "_" + name + " " + metric_type)
+            for sample_labels, value in samples:
+                lines.append(prefix + "_" + name + PipelineMetrics._format_labels(dict(report["labels"],
+                                                                                       **sample_labels)) +
+                             " " + repr(float(value)))
+
+        spans = report["spans"].items()
+        add("span_seconds_total", "counter", [({"span": name}, span["seconds"]) for name, span in spans])
+        add("span_count_total", "counter", [({"span": name}, span["count"]) for name, span in spans])
+        add("span_max_seconds", "gauge", [({"span": name}, span["max_seconds"]) for name, span in spans])
+        add("events_total", "counter", [({"counter": name}, value) for name, value in report["counters"].items()])
+        add("max", "gauge", [({"metric": name}, value) for name, value in report["maxima"].items()])
+        add("run_wall_seconds", "gauge", [({}, report["wall_seconds"])])
+        add("run_timestamp_seconds", "gauge", [({}, time.time())])
+        PipelineMetrics._write(path_to_file, "\n".join(lines) + "\n")
+
+    @staticmethod
+    def _format_labels(labels):
+        if len(labels) == 0:
+            return ""
+        escaped = [key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                   for key, value in sorted(labels.items())]
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _write(path_to_file, content):
+        # imported here, nfcDatabase itself records its writes with PipelineMetrics
+        from nfcDatabase import AtomicFile
+        os.makedirs(os.path.dirname(path_to_file) or ".", exist_ok=True)
+        # a unique temporary file, so a service export and a run writing the same metrics file do not collide
+        with AtomicFile(path_to_file, "w", encoding="utf-8") as f:
+            f.write(content)
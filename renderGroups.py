@@ -0,0 +1,60 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+"""
+RenderGroups groups identical phone renders, e.g. one render used for several storage or colour variants or listed
+under two names, by the content hash of the image (the key of the analysis cache, so the extra analysis arguments like
+the nfc feature number for Google are part of it). Only the first image of a group (its representative) is analyzed,
+the result is used for every other image of the group. Images which only look alike are not grouped: renders that
+differ in nothing but the position of the nfc marker are too close for any image hash.
+"""
+class RenderGroups:
+    def __init__(self):
+        # key -> representative
+        self._groups = {}
+        # representative -> [resolved, result, [file names waiting for the result]]
+        self._states = {}
+
+    def add(self, file_name, key):
+        # the representative of the group of the image, None if the image starts a new group and has to be analyzed
+        representative = self._groups.get(key)
+        if representative is not None:
+            return representative
+        self._groups[key] = file_name
+        self._states[file_name] = [False, None, []]
+        return None
+
+    def result_of(self, representative):
+        # (resolved, result) of the analysis of the representative
+        resolved, result, _ = self._states[representative]
+        return resolved, result
+
+    def wait_for(self, representative, file_name):
+        self._states[representative][2].append(file_name)
+
+    def resolve(self, representative, result):
+        # stores the result of a representative and returns the file names of the images waiting for it
+        state = self._states.get(representative)
+        if state is None:
+            return []
+        waiting = state[2]
+        self._states[representative] = [True, result, []]
+        return waiting
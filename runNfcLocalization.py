@@ -19,15 +19,46 @@
 """
 
 
-from findNfcChipForGoogle import FindNfcChipForGoogle as google
-from findNfcChipForSamsung import FindNfcChipForSamsung as samsung
-from findNfcChipForHuawei import FindNfcChipForHuawei as huawei
+import os
+import sys
+import json
+import argparse
+import importlib
+import multiprocessing
+from parallelAnalysis import ParallelAnalysis
+from imageCache import ImageCache
+from pipelineMetrics import PipelineMetrics
 
 
+"""
+RunNfcLocalization updates nfc_positions.json for the chosen vendors. Without arguments the interactive menu is
+shown, with arguments it runs as a batch job, e.g.
+    python runNfcLocalization.py --vendors samsung google --workers 8 --output nfcChipsOutput/nfc_positions.json
+Several vendors run concurrently in their own processes, the database merges their writes under its lock file.
+A vendor module is only imported when the vendor runs, so e.g. a Samsung run does not load easyocr.
+With --queue the run is split over a job queue (nfcJobs.py): one coordinator queues the images, workers on any host
+analyze them and merge writes the results, e.g.
+    python runNfcLocalization.py --queue queue/tasks.sqlite --role coordinator
+    python runNfcLocalization.py --queue queue/tasks.sqlite --role worker --workers 4
+    python runNfcLocalization.py --queue queue/tasks.sqlite --role merge
+With --serve the process keeps running and serves the lookups and vendor updates over HTTP (nfcService.py), e.g.
+    python runNfcLocalization.py --serve 8080 --refresh-interval 24
+"""
 class RunNfcLocalization:
+    # vendor -> (module, class)
+    VENDORS = {"samsung": ("findNfcChipForSamsung", "FindNfcChipForSamsung"),
+               "google": ("findNfcChipForGoogle", "FindNfcChipForGoogle"),
+               "huawei": ("findNfcChipForHuawei", "FindNfcChipForHuawei")}
+    # Huawei website was taken down
+    DEFAULT_VENDORS = ["samsung", "google"]
 
     @staticmethod
-    def main():
+    def vendor_class(vendor):
+        module_name, class_name = RunNfcLocalization.VENDORS[vendor]
+        return getattr(importlib.import_module(module_name), class_name)
+
+    @staticmethod
+    def menu():
         print("Wählen Sie für welche Datenbankeinträge aktualisiert werden sollen.")
         chosen_option = input("Tippen Sie '0' ein, um alle Datenbankeinträge zu aktualisieren. \n"
                               "Tippen Sie '1' ein, um Samsungs Datenbankeinträge zu aktualisieren. \n"
@@ -36,19 +67,207 @@ class RunNfcLocalization:
                               # "Tippen Sie '3' ein, um Huaweis Datenbankeinträge zu aktualisieren. \n"
                               "Bestätigen Sie die Eingabe mit Enter. \n"
                               "Jegliche anderweitige Eingabe beendet das Programm.\n")
+        workers = ParallelAnalysis.default_workers()
         if chosen_option == "0":
-            samsung.main()
-            # huawei.main()
-            google.main()
+            return RunNfcLocalization.run_vendors(RunNfcLocalization.DEFAULT_VENDORS, {"workers": workers})
         elif chosen_option == "1":
-            samsung.main()
+            return RunNfcLocalization.run_vendors(["samsung"], {"workers": workers})
         elif chosen_option == "2":
-            google.main()
+            return RunNfcLocalization.run_vendors(["google"], {"workers": workers})
         # elif chosen_option == "3":
-            # huawei.main()
+            # return RunNfcLocalization.run_vendors(["huawei"], {"workers": workers})
         else:
             quit()
 
+    @staticmethod
+    def parse_arguments(arguments):
+        parser = argparse.ArgumentParser(description="Update the nfc chip positions of the chosen vendors")
+        parser.add_argument("--vendors", nargs="+", choices=sorted(RunNfcLocalization.VENDORS),
+                            default=RunNfcLocalization.DEFAULT_VENDORS)
+        parser.add_argument("--workers", type=int, default=ParallelAnalysis.default_workers(),
+                            help="analysis worker processes, shared by all vendors")
+        parser.add_argument("--ocr-batch-size", type=int, help="images per batched text detection (Google)")
+        parser.add_argument("--edge-pyramid-levels", type=int,
+                            help="find the phone edge on the image downscaled this many times, 0 = full resolution")
+        parser.add_argument("--output", default="nfcChipsOutput/nfc_positions.json")
+        parser.add_argument("--image-cache-dir", help="default " + ImageCache.CACHE_DIR)
+        parser.add_argument("--analysis-cache-dir", help="default cache/analysis/")
+        parser.add_argument("--device-list-cache-dir", help="default cache/")
+        parser.add_argument("--catalog-cache-dir", help="default cache/catalog/")
+        parser.add_argument("--force-refresh", action="store_true",
+                            help="run the vendors even if their phones did not change since the last run")
+        parser.add_argument("--dry-run", action="store_true", help="print the entries instead of saving them")
+        parser.add_argument("--compact", action="store_true", help="save the database without indentation")
+        parser.add_argument("--sequential", action="store_true", help="run the vendors one after another")
+        parser.add_argument("--metrics-dir", help="write a json metrics report per vendor into this folder")
+        parser.add_argument("--prometheus-dir", help="write a Prometheus textfile per vendor into this folder")
+        parser.add_argument("--queue", metavar="LOCATION", help="job queue, e.g. queue/tasks.sqlite")
+        parser.add_argument("--role", choices=["coordinator", "worker", "merge", "status"],
+                            help="part of the queued run, worker starts --workers processes")
+        parser.add_argument("--wait", action="store_true", help="queue workers keep waiting for new tasks")
+        parser.add_argument("--serve", type=int, metavar="PORT",
+                            help="keep running and serve the lookups and updates over HTTP (nfcService.py)")
+        parser.add_argument("--host", default="127.0.0.1", help="address of --serve")
+        parser.add_argument("--refresh-interval", type=float, metavar="HOURS",
+                            help="with --serve, update all vendors every HOURS")
+        parser.add_argument("--lookup", nargs="+", metavar="MODEL",
+                            help="only print the entries of these model names (Build.MODEL) from --output")
+        parser.add_argument("--export-sqlite", metavar="PATH", help="only export --output as SQLite lookup file")
+        args = parser.parse_args(arguments)
+        if (args.queue is None) != (args.role is None):
+            parser.error("--queue and --role are only used together")
+        if args.serve is not None and args.queue is not None:
+            parser.error("--serve and --queue can not be used together")
+        if args.refresh_interval is not None and args.serve is None:
+            parser.error("--refresh-interval is only used with --serve")
+        return args
+
+    @staticmethod
+    def run_vendors(vendors, options, image_cache_dir=None, sequential=False, metrics=None):
+        # returns True if every vendor finished
+        if sequential or len(vendors) == 1:
+            success = True
+            for vendor in vendors:
+                try:
+                    RunNfcLocalization._run_vendor(vendor, options, image_cache_dir, metrics)
+                except Exception as e:
+                    print("Error: Update of " + vendor + " failed: " + repr(e))
+                    success = False
+            return success
+        # the workers are split between the vendors running at the same time
+        vendor_options = dict(options, workers=max(1, options.get("workers", 1) // len(vendors)))
+        processes = {vendor: multiprocessing.Process(target=RunNfcLocalization._run_vendor, name=vendor,
+                                                     args=(vendor, vendor_options, image_cache_dir, metrics))
+                     for vendor in vendors}
+        for process in processes.values():
+            process.start()
+        success = True
+        for vendor, process in processes.items():
+            process.join()
+            if process.exitcode != 0:
+                print("Error: Update of " + vendor + " failed with exit code " + str(process.exitcode))
+                success = False
+        return success
+
+    @staticmethod
+    def _run_vendor(vendor, options, image_cache_dir=None, metrics=None):
+        # metrics is (json report folder, Prometheus textfile folder), both optional
+        if image_cache_dir is not None:
+            ImageCache.configure(image_cache_dir)
+        if vendor != "google":
+            options = {key: value for key, value in options.items() if key != "ocr_batch_size"}
+        PipelineMetrics.reset()
+        try:
+            with PipelineMetrics.span("run"):
+                RunNfcLocalization.vendor_class(vendor).main(**options)
+        except Exception:
+            PipelineMetrics.count("vendor_failures")
+            raise
+        finally:
+            metrics_dir, prometheus_dir = metrics or (None, None)
+            if metrics_dir is not None:
+                PipelineMetrics.write_report(os.path.join(metrics_dir, vendor + ".json"), {"vendor": vendor})
+            if prometheus_dir is not None:
+                PipelineMetrics.write_prometheus(os.path.join(prometheus_dir, "nfc_localization_" + vendor + ".prom"),
+                                                 {"vendor": vendor})
+
+    @staticmethod
+    def run_queue_role(args):
+        # imported here, the job queue is only needed for queued runs
+        from jobQueue import JobQueue
+        from nfcJobs import NfcJobs
+        db_path, db_file_name = os.path.split(args.output)
+        if args.role == "worker" and args.workers > 1:
+            # every worker process opens its own connection to the queue
+            processes = [multiprocessing.Process(target=RunNfcLocalization._run_queue_worker,
+                                                 args=(args.queue, args.image_cache_dir, args.wait, None,
+                                                       args.edge_pyramid_levels))
+                         for _ in range(args.workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            return all(process.exitcode == 0 for process in processes)
+        queue = JobQueue.open(args.queue)
+        try:
+            if args.role == "coordinator":
+                NfcJobs.coordinate(queue, args.vendors, os.path.join(db_path, ""), db_file_name, args.force_refresh,
+                                   args.catalog_cache_dir)
+            elif args.role == "worker":
+                RunNfcLocalization._run_queue_worker(args.queue, args.image_cache_dir, args.wait, queue,
+                                                     args.edge_pyramid_levels)
+            elif args.role == "merge":
+                NfcJobs.merge(queue, os.path.join(db_path, ""), db_file_name, args.device_list_cache_dir,
+                              args.dry_run, args.compact)
+            print("Tasks: " + json.dumps(queue.counts()))
+        finally:
+            queue.close()
+        return True
+
+    @staticmethod
+    def _run_queue_worker(location, image_cache_dir=None, wait=False, queue=None, edge_pyramid_levels=None):
+        from jobQueue import JobQueue
+        from nfcJobs import NfcJobs
+        if image_cache_dir is not None:
+            ImageCache.configure(image_cache_dir)
+        worker_queue = queue or JobQueue.open(location)
+        try:
+            NfcJobs.work(worker_queue, wait=wait, edge_pyramid_levels=edge_pyramid_levels)
+        finally:
+            if queue is None:
+                worker_queue.close()
+
+    @staticmethod
+    def serve(args, options):
+        # imported here, the HTTP service is only needed with --serve
+        from nfcService import NfcService
+        service = NfcService(args.vendors, options, args.image_cache_dir, (args.metrics_dir, args.prometheus_dir),
+                             args.refresh_interval)
+        return service.serve(args.host, args.serve)
+
+    @staticmethod
+    def query(path_to_file, model_names, sqlite_file=None):
+        # read only, no vendor module is loaded
+        from nfcPositionLookup import NfcPositionLookup
+        lookup = NfcPositionLookup.from_json(path_to_file)
+        for model_name in model_names:
+            print(model_name + ": " + json.dumps(lookup.lookup(model_name), ensure_ascii=False))
+        if sqlite_file is not None:
+            lookup.export_sqlite(sqlite_file)
+            print("Exported " + str(len(lookup.entries)) + " entries to " + sqlite_file)
+        return True
+
+    @staticmethod
+    def main(arguments=None):
+        arguments = sys.argv[1:] if arguments is None else arguments
+        if len(arguments) == 0:
+            return RunNfcLocalization.menu()
+        args = RunNfcLocalization.parse_arguments(arguments)
+        if args.lookup or args.export_sqlite:
+            return RunNfcLocalization.query(args.output, args.lookup or [], args.export_sqlite)
+        if args.queue is not None:
+            return RunNfcLocalization.run_queue_role(args)
+        db_path, db_file_name = os.path.split(args.output)
+        options = {"workers": args.workers, "db_path": os.path.join(db_path, ""), "db_file_name": db_file_name,
+                   "analysis_cache_dir": args.analysis_cache_dir,
+                   "device_list_cache_dir": args.device_list_cache_dir, "dry_run": args.dry_run}
+        if args.ocr_batch_size is not None:
+            options["ocr_batch_size"] = args.ocr_batch_size
+        if args.force_refresh:
+            options["force"] = True
+        if args.catalog_cache_dir is not None:
+            options["catalog_cache_dir"] = args.catalog_cache_dir
+        if args.edge_pyramid_levels is not None:
+            options["edge_pyramid_levels"] = args.edge_pyramid_levels
+        if args.compact:
+            options["compact"] = True
+        if args.serve is not None:
+            return RunNfcLocalization.serve(args, options)
+        return RunNfcLocalization.run_vendors(args.vendors, options, args.image_cache_dir, args.sequential,
+                                              (args.metrics_dir, args.prometheus_dir))
+
 
-# run code
-RunNfcLocalization.main()
+# run code - guarded because the worker processes of the image analysis import this module again
+if __name__ == "__main__":
+    if not RunNfcLocalization.main():
+        sys.exit(1)
@@ -0,0 +1,176 @@
+"""
+/*
+ * Copyright (c) 2024 gematik GmbH
+ *
+ * Licensed under the EUPL, Version 1.2 or – as soon they will be approved by
+ * the European Commission - subsequent versions of the EUPL (the Licence);
+ * You may not use this work except in compliance with the Licence.
+ * You may obtain a copy of the Licence at:
+ *
+ *     https://joinup.ec.europa.eu/software/page/eupl
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the Licence is distributed on an "AS IS" basis,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the Licence for the specific language governing permissions and
+ * limitations under the Licence.
+ *
+ */
+"""
+
+
+import os
+import json
+import hashlib
+from imageDownloader import ImageDownloader
+from nfcDatabase import NfcDatabase, AtomicFile
+from pipelineMetrics import PipelineMetrics
+
+"""
+VendorCatalog tells whether the phone list of a vendor page changed since the last finished run into the same database
+file. The page is fetched with a conditional GET (ETag / Last-Modified of the last run) and the phones found on it are
+kept as model name -> [image url, nfc feature number]. There is one file per vendor and database file in
+cache/catalog/, it is only written by save() after a run finished, so an aborted run is repeated.
+Every phone of a finished run has a final state: located, not located (the analysis found no chip, it is only analyzed
+again with another image or nfc feature number), no nfc feature or queued (handed to the job queue). Phones whose
+download or analysis failed are not recorded, so the next run tries them again. A vendor is skipped if nothing on its
+page is new or changed and every located phone still has its entry in the database. force ignores the last run.
+"""
+class VendorCatalog:
+    CACHE_DIR = "cache/catalog/"
+    LOCATED = "located"
+    NOT_LOCATED = "not located"
+    NO_FEATURE = "no nfc feature"
+    QUEUED = "queued"
+
+    def __init__(self, vendor, db_path, db_file_name, cache_dir=None, force=False):
+        self.vendor = vendor
+        self.force = force
+        self.database = NfcDatabase.get(db_path, db_file_name)
+        # a run into another database file does not compare with this one
+        database_key = hashlib.sha256(self.database.path_to_file.encode("utf-8")).hexdigest()[:12]
+        self.path_to_file = os.path.join(cache_dir or VendorCatalog.CACHE_DIR,
+                                         vendor.lower() + "-" + database_key + ".json")
+        self.phones = {}
+        # model name -> state of the phones settled in this run before save, e.g. without nfc feature
+        self.states = {}
+        self.not_modified = False
+        self._etag = None
+        self._last_modified = None
+        self._previous = {}
+        if os.path.exists(self.path_to_file) and not force:
+            try:
+                with open(self.path_to_file, "r", encoding="utf-8") as f:
+                    self._previous = json.load(f)
+            except (OSError, ValueError):
+                print("Error: Vendor catalog " + self.path_to_file + " could not be read")
+        # the phones of a catalog without states all had an entry
+        self._previous_states = self._previous.get("states", {model_name: VendorCatalog.LOCATED
+                                                              for model_name in self._previous.get("phones", {})})
+
+    def fetch(self, url):
+        # the content of the page or None if it was not modified since the last run
+        headers = {}
+        # the phones of the page are needed again if an entry of the last run is missing
+        if self._located_in_database():
+            if self._previous.get("etag"):
+                headers["If-None-Match"] = self._previous["etag"]
+            if self._previous.get("last_modified"):
+                headers["If-Modified-Since"] = self._previous["last_modified"]
+        with PipelineMetrics.span("catalog_fetch"):
+            response = ImageDownloader.get_session().get(url, headers=headers, timeout=ImageDownloader.TIMEOUT)
+        if response.status_code == 304 and "phones" in self._previous:
+            PipelineMetrics.count("catalog_not_modified")
+            self.not_modified = True
+            self.phones = dict(self._previous["phones"])
+            self._etag, self._last_modified = self._previous.get("etag"), self._previous.get("last_modified")
+            return None
+        response.raise_for_status()
+        self._etag, self._last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        return response.content
+
+    def add(self, model_name, image_src, feature_number=None):
+        self.phones[model_name] = [str(image_src).strip(), feature_number]
+
+    def set_state(self, model_name, state):
+        self.states[model_name] = state
+
+    def is_changed(self, model_name):
+        # a phone of the last run with another image or nfc feature number now, new phones are not "changed"
+        previous = self._previous.get("phones", {})
+        return model_name in previous and previous[model_name] != self.phones.get(model_name)
+
+    def was_not_located(self, model_name):
+        # the analysis of the last run found no chip on the same image with the same nfc feature number
+        return self._previous_states.get(model_name) == VendorCatalog.NOT_LOCATED and not self.is_changed(model_name)
+
+    def _located_in_database(self):
+        return all(self.database.contains_marketing_name(model_name)
+                   for model_name, state in self._previous_states.items() if state == VendorCatalog.LOCATED)
+
+    @staticmethod
+    def fingerprint(phones):
+        return hashlib.sha256(json.dumps(sorted(phones.items())).encode("utf-8")).hexdigest()
+
+    def unchanged(self):
+        # the same phones as in the last run and the located ones still have their entry
+        return not self.force and (self.not_modified or VendorCatalog.fingerprint(self.phones) ==
+                                   self._previous.get("fingerprint")) and self._located_in_database()
+
+    def diff(self):
+        # (added, changed, removed) model names compared to the last run
+        previous = self._previous.get("phones", {})
+        added = sorted(name for name in self.phones if name not in previous)
+        changed = sorted(name for name in self.phones if name in previous and previous[name] != self.phones[name])
+        removed = sorted(name for name in previous if name not in self.phones)
+        return added, changed, removed
+
+    def print_diff(self):
+        if "phones" not in self._previous:
+            print(self.vendor + ": " + str(len(self.phones)) + " phones on the vendor page, no earlier run to compare")
+            return
+        for label, names in zip(["added", "changed", "removed"], self.diff()):
+            if len(names) > 0:
+                print(self.vendor + " " + label + ": " + ", ".join(names))
+
+    def _state_of(self, model_name, not_located):
+        # the final state of a phone after this run, None if it is not settled
+        if model_name in self.states:
+            return self.states[model_name]
+        if model_name in not_located:
+            return VendorCatalog.NOT_LOCATED
+        if self.database.contains_marketing_name(model_name):
+            return VendorCatalog.LOCATED
+        previous_state = self._previous_states.get(model_name)
+        if previous_state in (VendorCatalog.NOT_LOCATED, VendorCatalog.QUEUED) and not self.is_changed(model_name):
+            return previous_state
+        return None
+
+    def save(self, failed=(), not_located=()):
+        # failed are the model names whose download or analysis failed in this run, not_located the ones analyzed
+        # without finding a chip - failed phones and phones without a final state keep the state of the last run (or
+        # are left out), so the next run analyzes them again
+        previous = self._previous.get("phones", {})
+        failed = set(failed)
+        not_located = set(not_located)
+        phones = {}
+        states = {}
+        for model_name, phone in self.phones.items():
+            state = self._state_of(model_name, not_located) if model_name not in failed else None
+            if state is not None:
+                phones[model_name] = phone
+                states[model_name] = state
+            elif model_name in previous:
+                failed.add(model_name)
+                phones[model_name] = previous[model_name]
+                states[model_name] = self._previous_states.get(model_name)
+            else:
+                failed.add(model_name)
+        # without the validators of the page the next run gets its phones again instead of a 304
+        complete = len(failed) == 0
+        os.makedirs(os.path.dirname(self.path_to_file) or ".", exist_ok=True)
+        with AtomicFile(self.path_to_file, "w", encoding="utf-8") as f:
+            json.dump({"vendor": self.vendor, "etag": self._etag if complete else None,
+                       "last_modified": self._last_modified if complete else None,
+                       "fingerprint": VendorCatalog.fingerprint(phones), "phones": phones, "states": states}, f,
+                      ensure_ascii=False)